@@ -1,13 +1,28 @@
 import random
 import math
+import json
+import os
+import timeit
+import numpy as np
 
 n_cities = 100
 n_dimensions = 7
 max_iterations = math.ceil(1.1 * (n_cities ** 2))
-turns_improved = 0
 improve_thresh = 2 * math.floor(math.sqrt(max_iterations))
-tabu_list = []
-tabu_tenure = n_cities
+# swap (every pair of cities), 2opt, oropt or 2opt+oropt, the last three only try the n_candidates nearest cities
+neighbourhood = 'swap'
+n_candidates = 8
+# move: swapping the same positions again or adding back a removed edge is tabu, city: moving a recently moved city
+tabu_type = 'move'
+tabu_tenure = n_cities if tabu_type == 'move' else max(5, n_cities // 10)
+# matrix: float32 distance matrix, on_demand: distances computed from the coordinates, only candidate lists are kept
+max_matrix_cities = 4000
+block_rows = 256
+# random, nearest (nearest neighbour over the candidate lists), greedy (shortest candidate edges first) or curve
+# (order along a Hilbert curve through all dimensions)
+initial_tour = 'random'
+SETTINGS = ('max_iterations', 'improve_thresh', 'neighbourhood', 'n_candidates', 'tabu_type', 'tabu_tenure',
+            'max_matrix_cities', 'block_rows', 'initial_tour')
 
 '''
 paramtry:
@@ -46,57 +61,592 @@ for x in range(i, j):
     '''
 
 
-def distance(city1, city2):
-    return math.sqrt(sum([(city1[i] - city2[i]) ** 2 for i in range(n_dimensions)]))
-
-
-cities = [[random.randint(0, 100) for j in range(n_dimensions)] for i in range(n_cities)]
-distances = [[distance(cities[i], cities[j]) for j in range(n_cities)] for i in range(n_cities)]
-
-total = 0
-for i in range(n_cities):
-    for j in range(n_cities):
-        total += distances[i][j]
-
-# Metryczny problem komiwojażera - powinniśmy znaleźcco najwyżej 2 razy rozwiązanie optymalne (dlatego * 2.2)
-aspiration_criteria = (total / (n_cities ** 2)) * 2.2
-
-current_solution = list(range(n_cities))
-random.shuffle(current_solution)
-best_solution = current_solution[:]
-best_solution_cost = sum(
-    [distances[current_solution[i]][current_solution[(i + 1) % n_cities]] for i in range(n_cities)])
-
-for iteration in range(max_iterations):
-    if turns_improved > improve_thresh:
-        break
-    best_neighbor = None
-    best_neighbor_cost = float('inf')
-    coordA, coordB = 0, 0
-    for i in range(n_cities):
-        for j in range(i + 1, n_cities):
-            neighbor = current_solution[:]
-            neighbor[i], neighbor[j] = neighbor[j], neighbor[i]
-            neighbor_cost = sum([distances[neighbor[i]][neighbor[(i + 1) % n_cities]] for i in range(n_cities)])
-            if (i, j) not in tabu_list or neighbor_cost < best_neighbor_cost:
-                if neighbor_cost < aspiration_criteria:
-                    best_neighbor = neighbor[:]
-                    best_neighbor_cost = neighbor_cost
-                coordA, coordB = i, j
-    if best_neighbor is not None:
-        current_solution = best_neighbor[:]
-        tabu_list.append((coordA, coordB))
-
-        if len(tabu_list) > tabu_tenure:
-            tabu_list.pop(0)
-        if best_neighbor_cost < best_solution_cost:
-            best_solution = best_neighbor[:]
-            best_solution_cost = best_neighbor_cost
-            turns_improved = 0
+def distance_block(points, start, stop, first=0):
+    """Distances from the cities start..stop-1 to every city from ``first`` on, |a|^2 + |b|^2 - 2ab so that a
+    block needs no (rows, cities, dimensions) array of differences."""
+    rows, columns = points[start:stop], points[first:]
+    squared = (rows * rows).sum(axis=1)[:, None] + (columns * columns).sum(axis=1)[None, :] - 2 * rows @ columns.T
+    return np.sqrt(np.maximum(squared, 0)).astype(np.float32)
+
+
+def distance_matrix(points, rows=block_rows):
+    """float32 matrix of all distances. Only the upper triangle is computed, in blocks of ``rows``, and mirrored."""
+    n = len(points)
+    matrix = np.empty((n, n), dtype=np.float32)
+    for start in range(0, n, rows):
+        stop = min(start + rows, n)
+        block = distance_block(points, start, stop, start)
+        matrix[start:stop, start:] = block
+        matrix[stop:, start:stop] = block[:, stop - start:].T
+        square = matrix[start:stop, start:stop]
+        lower = np.tril_indices(stop - start, -1)
+        square[lower] = square.T[lower]
+        np.fill_diagonal(square, 0)
+    return matrix
+
+
+class DistanceRow:
+    """Row of the distances of one city computed on access, stands in for a matrix row in the on_demand mode."""
+    __slots__ = ('cities', 'city')
+
+    def __init__(self, cities, city):
+        self.cities = cities
+        self.city = city
+
+    def __getitem__(self, other):
+        return math.dist(self.cities[self.city], self.cities[other])
+
+
+def random_cities(n, seed=None):
+    rnd = random if seed is None else random.Random(seed)
+    return [[rnd.randint(0, 100) for j in range(n_dimensions)] for i in range(n)]
+
+
+EPSILON = 1e-9
+
+
+class TabuMemory:
+    """Tabu until stamps counted in moves made. A key is tabu while its stamp is ahead of the move counter, so
+    checking is O(1) and entries expire without being removed. Cities have an array of stamps, move keys (pairs
+    of positions or edges) a dict that drops expired entries once it outgrows the tenure."""
+
+    def __init__(self, tenure, kind, n_cities):
+        self.tenure = tenure
+        self.kind = kind
+        self.moves = 0
+        self.city_until = [0] * n_cities
+        self.key_until = {}
+
+    def is_tabu(self, keys):
+        if self.kind == 'city':
+            until = self.city_until
+            for city in keys:
+                if until[city] > self.moves:
+                    return True
+            return False
+        until = self.key_until
+        for key in keys:
+            if key in until and until[key] > self.moves:
+                return True
+        return False
+
+    def admissible(self, keys, cost, best_cost):
+        """Not tabu, or aspiration: the move gives a tour better than the best one found."""
+        return cost < best_cost - EPSILON or not self.is_tabu(keys)
+
+    def add(self, keys):
+        self.moves += 1
+        until = self.moves + self.tenure
+        if self.kind == 'city':
+            for city in keys:
+                self.city_until[city] = until
+            return
+        for key in keys:
+            self.key_until[key] = until
+        if len(self.key_until) > 8 * self.tenure:
+            self.key_until = {key: stamp for key, stamp in self.key_until.items() if stamp > self.moves}
+
+
+def swap_keys(tour, i, j, kind):
+    return (tour[i], tour[j]) if kind == 'city' else ((i, j),)
+
+
+def edge(a, b):
+    return (a, b) if a < b else (b, a)
+
+
+def hilbert_index(grid, bits):
+    """Index along the Hilbert curve of every row of integer coordinates below 2 ** bits, Skilling's transposition
+    applied to all rows at once and its bits interleaved into one number."""
+    x = grid.astype(np.uint64)
+    n_dims = x.shape[1]
+    q = 1 << (bits - 1)
+    while q > 1:
+        p = np.uint64(q - 1)
+        for i in range(n_dims):
+            high = (x[:, i] & np.uint64(q)) != 0
+            x[high, 0] ^= p
+            low = ~high
+            t = (x[low, 0] ^ x[low, i]) & p
+            x[low, 0] ^= t
+            x[low, i] ^= t
+        q >>= 1
+    for i in range(1, n_dims):
+        x[:, i] ^= x[:, i - 1]
+    t = np.zeros(len(x), dtype=np.uint64)
+    q = 1 << (bits - 1)
+    while q > 1:
+        t ^= np.where((x[:, -1] & np.uint64(q)) != 0, np.uint64(q - 1), np.uint64(0))
+        q >>= 1
+    x ^= t[:, None]
+    index = np.zeros(len(x), dtype=np.uint64)
+    for bit in range(bits - 1, -1, -1):
+        for i in range(n_dims):
+            index = (index << np.uint64(1)) | ((x[:, i] >> np.uint64(bit)) & np.uint64(1))
+    return index
+
+
+def edge_keys(removed, added, kind):
+    """Tabu keys of a move: the edges it adds, which are tabu once removed, or the cities whose neighbours change."""
+    return {city for e in removed for city in e} if kind == 'city' else added
+
+
+class Instance:
+    """The cities searched over with everything read while searching them: the settings, the distances and the
+    candidate lists. The settings start from the defaults at the top of this module, the ones that depend on the
+    number of cities sized for ``cities``, and ``params`` overrides any of SETTINGS. ``shared_matrix`` is a distance
+    matrix built already, e.g. one in shared memory. Nothing of an instance is kept in the module, so searches over
+    different instances or with different settings can run side by side."""
+
+    def __init__(self, cities, params=None, shared_matrix=None):
+        params = params or {}
+        unknown = set(params) - set(SETTINGS)
+        if unknown:
+            raise ValueError(f'Unknown TSTSP settings: {sorted(unknown)}')
+        n = len(cities)
+        settings = {name: globals()[name] for name in SETTINGS}
+        settings['max_iterations'] = params.get('max_iterations', math.ceil(1.1 * (n ** 2)))
+        settings['improve_thresh'] = 2 * math.floor(math.sqrt(settings['max_iterations']))
+        settings['tabu_tenure'] = n if params.get('tabu_type', tabu_type) == 'move' else max(5, n // 10)
+        # Overrides of the settings sized above win
+        settings.update(params)
+        self.settings = settings
+        for name, value in settings.items():
+            setattr(self, name, value)
+
+        self.cities = cities
+        self.n_cities = n
+        self.points = np.array(cities, dtype=np.float64).reshape(n, -1)
+        if shared_matrix is not None:
+            self.distance_mode = 'matrix'
+            self.matrix = shared_matrix
+        else:
+            self.distance_mode = 'matrix' if n <= self.max_matrix_cities else 'on_demand'
+            self.matrix = distance_matrix(self.points, self.block_rows) if self.distance_mode == 'matrix' else None
+        if self.matrix is not None:
+            # Rows are read as memoryviews, indexing them gives plain floats and is much faster than indexing the array
+            self.distances = [memoryview(row) for row in self.matrix]
+        else:
+            self.distances = [DistanceRow(cities, city) for city in range(n)]
+        self.neighbourhood_moves = NEIGHBOURHOODS.get(self.neighbourhood)
+        self.candidates = self.nearest_neighbours(min(self.n_candidates, n - 1)) \
+            if self.neighbourhood != 'swap' else None
+
+    def tour_cost(self, tour):
+        n, distances = self.n_cities, self.distances
+        return sum([distances[tour[i]][tour[(i + 1) % n]] for i in range(n)])
+
+    def swap_delta(self, tour, i, j):
+        """Change of the tour cost when the cities at positions i < j swap places, only the edges at both positions
+        change. Adjacent positions, also across the end of the tour, share an edge that keeps its length."""
+        n = self.n_cities
+        if n <= 3:
+            return 0.0
+        a, b = tour[i], tour[j]
+        distances_a, distances_b = self.distances[a], self.distances[b]
+        prev_i, next_j = tour[i - 1], tour[(j + 1) % n]
+        if j - i == 1:
+            return distances_b[prev_i] + distances_a[next_j] - distances_a[prev_i] - distances_b[next_j]
+        next_i, prev_j = tour[i + 1], tour[j - 1]
+        if i == 0 and j == n - 1:
+            return distances_a[prev_j] + distances_b[next_i] - distances_b[prev_j] - distances_a[next_i]
+        return (distances_b[prev_i] + distances_b[next_i] + distances_a[prev_j] + distances_a[next_j]) \
+            - (distances_a[prev_i] + distances_a[next_i] + distances_b[prev_j] + distances_b[next_j])
+
+    def best_swap(self, tour, cost, best_cost, tabu):
+        """The best admissible pairwise swap, returns ((i, j) or None, delta)."""
+        n, swap_delta = self.n_cities, self.swap_delta
+        best_neighbor = None
+        best_delta = float('inf')
+        for i in range(n):
+            for j in range(i + 1, n):
+                delta = swap_delta(tour, i, j)
+                if delta < best_delta and tabu.admissible(swap_keys(tour, i, j, tabu.kind), cost + delta, best_cost):
+                    best_neighbor = (i, j)
+                    best_delta = delta
+        return best_neighbor, best_delta
+
+    def nearest_neighbours(self, k):
+        """Candidate lists, the k closest other cities of every city. Taken from the matrix, or from distances
+        computed one block of rows at a time when there is none."""
+        n, rows, points, matrix = self.n_cities, self.block_rows, self.points, self.matrix
+        neighbours = []
+        for start in range(0, n, rows):
+            stop = min(start + rows, n)
+            block = distance_block(points, start, stop) if matrix is None else matrix[start:stop].copy()
+            block[np.arange(stop - start), np.arange(start, stop)] = np.inf
+            nearest = np.argpartition(block, k - 1, axis=1)[:, :k]
+            order = np.argsort(np.take_along_axis(block, nearest, axis=1), axis=1, kind='stable')
+            neighbours.extend(np.take_along_axis(nearest, order, axis=1).tolist())
+        return neighbours
+
+    def nearest_neighbour_tour(self, neighbours):
+        """From city 0 always on to the closest unvisited candidate. Only when every candidate is visited already
+        are all unvisited cities measured, at once with NumPy."""
+        n, points = self.n_cities, self.points
+        visited = [False] * n
+        unvisited = np.ones(n, dtype=bool)
+        tour = [0]
+        visited[0], unvisited[0] = True, False
+        current = 0
+        for _ in range(n - 1):
+            for city in neighbours[current]:
+                if not visited[city]:
+                    break
+            else:
+                left = np.flatnonzero(unvisited)
+                city = int(left[np.argmin(((points[left] - points[current]) ** 2).sum(axis=1))])
+            tour.append(city)
+            visited[city], unvisited[city] = True, False
+            current = city
+        return tour
+
+    def greedy_edge_tour(self, neighbours):
+        """Candidate edges from the shortest on, taken while both cities have fewer than two and they close no
+        cycle. The fragments left are chained from the end of one to the closest free end of another."""
+        n, points = self.n_cities, self.points
+        starts = np.repeat(np.arange(n), [len(row) for row in neighbours])
+        ends = np.fromiter((city for row in neighbours for city in row), dtype=np.int64, count=len(starts))
+        order = np.argsort(((points[starts] - points[ends]) ** 2).sum(axis=1), kind='stable')
+        parent = list(range(n))
+
+        def root(city):
+            while parent[city] != city:
+                parent[city] = parent[parent[city]]
+                city = parent[city]
+            return city
+
+        links = [[] for _ in range(n)]
+        for a, b in zip(starts[order].tolist(), ends[order].tolist()):
+            if len(links[a]) < 2 and len(links[b]) < 2:
+                root_a, root_b = root(a), root(b)
+                if root_a != root_b:
+                    parent[root_a] = root_b
+                    links[a].append(b)
+                    links[b].append(a)
+
+        free = np.array([city for city in range(n) if len(links[city]) < 2])
+        open_ends = np.ones(len(free), dtype=bool)
+        slot = {city: i for i, city in enumerate(free.tolist())}
+        tour = []
+        start = int(free[0])
+        while True:
+            previous, city = -1, start
+            while True:
+                tour.append(city)
+                following = [other for other in links[city] if other != previous]
+                if not following:
+                    break
+                previous, city = city, following[0]
+            open_ends[slot[start]] = open_ends[slot[city]] = False
+            if len(tour) == n:
+                return tour
+            left = free[open_ends]
+            start = int(left[np.argmin(((points[left] - points[city]) ** 2).sum(axis=1))])
+
+    def curve_tour(self):
+        """Cities sorted by their index along a Hilbert curve through the coordinates scaled to a grid."""
+        points = self.points
+        bits = max(1, min(16, 64 // points.shape[1]))
+        low = points.min(axis=0)
+        span = points.max(axis=0) - low
+        span[span == 0] = 1
+        grid = np.rint((points - low) / span * ((1 << bits) - 1)).astype(np.int64)
+        return np.argsort(hilbert_index(grid, bits), kind='stable').tolist()
+
+    def initial_solution(self, kind=None, rnd=random):
+        """Starting tour of the kind in ``initial_tour`` unless another one is given."""
+        n = self.n_cities
+        kind = self.initial_tour if kind is None else kind
+        if kind == 'random' or n < 4:
+            return rnd.sample(range(n), n)
+        if kind == 'curve':
+            return self.curve_tour()
+        neighbours = self.candidates if self.candidates is not None \
+            else self.nearest_neighbours(min(self.n_candidates, n - 1))
+        if kind == 'nearest':
+            return self.nearest_neighbour_tour(neighbours)
+        if kind == 'greedy':
+            return self.greedy_edge_tour(neighbours)
+        raise ValueError(f'Unknown initial tour "{kind}"')
+
+    def two_opt_moves(self, tour, positions, a):
+        """2-opt moves that connect city a to one of its candidates c: either the successors or the predecessors
+        of a and c get connected too. Yields (delta, move)."""
+        n, distances = self.n_cities, self.distances
+        i = positions[a]
+        succ_a, pred_a = tour[(i + 1) % n], tour[i - 1]
+        distances_a = distances[a]
+        for c in self.candidates[a]:
+            j = positions[c]
+            succ_c, pred_c = tour[(j + 1) % n], tour[j - 1]
+            if c != succ_a and succ_c != a:
+                yield distances_a[c] + distances[succ_a][succ_c] - distances_a[succ_a] - distances[c][succ_c], \
+                    ('2opt', i, j)
+            if c != pred_a and pred_c != a:
+                yield distances_a[c] + distances[pred_a][pred_c] - distances_a[pred_a] - distances[c][pred_c], \
+                    ('2opt', (i - 1) % n, (j - 1) % n)
+
+    def or_opt_moves(self, tour, positions, a):
+        """Or-opt moves of the segment of 1 to 3 cities starting at city a next to one of the candidates of a, in
+        the better of both orientations. Yields (delta, move)."""
+        n, distances, candidates_a = self.n_cities, self.distances, self.candidates[a]
+        i = positions[a]
+        for length in range(1, min(3, n - 3) + 1):
+            segment = [tour[(i + k) % n] for k in range(length)]
+            first, last = segment[0], segment[-1]
+            prev, following = tour[i - 1], tour[(i + length) % n]
+            removal = distances[prev][following] - distances[prev][first] - distances[last][following]
+            distances_first, distances_last = distances[first], distances[last]
+            for c in candidates_a:
+                if c in segment:
+                    continue
+                j = positions[c]
+                for u, v in ((tour[j - 1], c), (c, tour[(j + 1) % n])):
+                    if u in segment or v in segment:
+                        continue
+                    # u - first ... last - v keeps the orientation, u - last ... first - v reverses the segment
+                    kept = distances_first[u] + distances_last[v]
+                    reversed_ = distances_last[u] + distances_first[v]
+                    yield removal + min(kept, reversed_) - distances[u][v], ('oropt', i, length, u, reversed_ < kept)
+
+    def move_edges(self, tour, positions, move):
+        """(removed edges, added edges) of a move."""
+        n = self.n_cities
+        if move[0] == '2opt':
+            _, i, j = move
+            a, succ_a, c, succ_c = tour[i], tour[(i + 1) % n], tour[j], tour[(j + 1) % n]
+            return (edge(a, succ_a), edge(c, succ_c)), (edge(a, c), edge(succ_a, succ_c))
+        _, i, length, u, reverse = move
+        first, last = tour[i], tour[(i + length - 1) % n]
+        prev, following = tour[i - 1], tour[(i + length) % n]
+        v = tour[(positions[u] + 1) % n]
+        head, tail = (last, first) if reverse else (first, last)
+        return (edge(prev, first), edge(last, following), edge(u, v)), \
+            (edge(prev, following), edge(u, head), edge(tail, v))
+
+    def apply_move(self, tour, positions, move):
+        n = self.n_cities
+        if move[0] == '2opt':
+            # Reconnecting after positions i and j reverses the cities between them, or equally the rest of the tour
+            _, i, j = move
+            start, length = (i + 1) % n, (j - i) % n
+            if 2 * length > n:
+                start, length = (j + 1) % n, n - length
+            for k in range(length // 2):
+                x, y = (start + k) % n, (start + length - 1 - k) % n
+                tour[x], tour[y] = tour[y], tour[x]
+                positions[tour[x]], positions[tour[y]] = x, y
         else:
-            turns_improved = turns_improved + 1
+            _, i, length, u, reverse = move
+            segment = [tour[(i + k) % n] for k in range(length)]
+            rest = [tour[(i + length + k) % n] for k in range(n - length)]
+            insert_at = rest.index(u) + 1
+            tour[:] = rest[:insert_at] + (segment[::-1] if reverse else segment) + rest[insert_at:]
+            for position, city in enumerate(tour):
+                positions[city] = position
+
+    def best_candidate_move(self, tour, positions, cost, best_cost, tabu, dont_look):
+        """The best admissible move of the selected neighbourhoods around cities whose don't-look bit is off. A
+        city that has no improving move gets its bit set. When none of the cities scanned has an admissible move,
+        e.g. all at a local optimum are tabu, the bits are cleared and every city is scanned so the search can
+        climb out."""
+        n, move_edges = self.n_cities, self.move_edges
+        best = None
+        skipped = True
+        while best is None and skipped:
+            if all(dont_look):
+                for city in range(n):
+                    dont_look[city] = False
+            skipped = False
+            for a in range(n):
+                if dont_look[a]:
+                    skipped = True
+                    continue
+                improving = False
+                for moves in self.neighbourhood_moves:
+                    for delta, move in moves(self, tour, positions, a):
+                        improving = improving or delta < -EPSILON
+                        if best is not None and delta >= best[0]:
+                            continue
+                        removed, added = move_edges(tour, positions, move)
+                        if not tabu.admissible(edge_keys(removed, added, tabu.kind), cost + delta, best_cost):
+                            continue
+                        best = (delta, removed, added, move)
+                if not improving:
+                    dont_look[a] = True
+            if best is None and skipped:
+                for city in range(n):
+                    dont_look[city] = False
+        return best
+
+
+NEIGHBOURHOODS = {'2opt': [Instance.two_opt_moves], 'oropt': [Instance.or_opt_moves],
+                  '2opt+oropt': [Instance.two_opt_moves, Instance.or_opt_moves]}
+
+
+class SearchState:
+    """Everything the search needs to go on from where it is: the instance, the current and the best tour, the tabu
+    memory, the don't-look bits and the counters. ``step`` makes one move, ``save`` and ``load`` checkpoint it as
+    JSON."""
+
+    def __init__(self, instance, tour):
+        self.instance = instance
+        self.current_solution = tour[:]
+        self.current_cost = instance.tour_cost(tour)
+        self.best_solution = tour[:]
+        self.best_solution_cost = self.current_cost
+        self.start_cost = self.current_cost
+        self.iteration = 0
+        self.improvements = 0
+        self.turns_improved = 0
+        self.seconds = 0.0
+        self.finished = False
+        self.tabu = TabuMemory(instance.tabu_tenure, instance.tabu_type, instance.n_cities)
+        self.dont_look = [False] * instance.n_cities
+        self.positions = [0] * instance.n_cities
+        for position, city in enumerate(tour):
+            self.positions[city] = position
+
+    def step(self):
+        """Makes the best admissible move, returns whether it gave a new best tour. Sets ``finished`` instead when
+        there is none or after improve_thresh iterations without improvement."""
+        instance = self.instance
+        if self.turns_improved > instance.improve_thresh:
+            self.finished = True
+            return False
+        tour, tabu = self.current_solution, self.tabu
+        if instance.neighbourhood == 'swap':
+            best_neighbor, delta = instance.best_swap(tour, self.current_cost, self.best_solution_cost, tabu)
+            if best_neighbor is None:
+                self.finished = True
+                return False
+            i, j = best_neighbor
+            tabu.add(swap_keys(tour, i, j, tabu.kind))
+            tour[i], tour[j] = tour[j], tour[i]
+            self.positions[tour[i]], self.positions[tour[j]] = i, j
+        else:
+            best_move = instance.best_candidate_move(tour, self.positions, self.current_cost, self.best_solution_cost,
+                                                     tabu, self.dont_look)
+            if best_move is None:
+                self.finished = True
+                return False
+            delta, removed, added, move = best_move
+            # The removed edges become tabu to add back, or the cities they touched to move again
+            tabu.add({city for e in removed for city in e} if tabu.kind == 'city' else removed)
+            instance.apply_move(tour, self.positions, move)
+            for e in removed + added:
+                for city in e:
+                    self.dont_look[city] = False
+        self.current_cost += delta
+        self.iteration += 1
+
+        if self.current_cost < self.best_solution_cost - EPSILON:
+            # The deltas drift by rounding, the cost of a new best tour is summed again
+            self.current_cost = instance.tour_cost(tour)
+            self.best_solution = tour[:]
+            self.best_solution_cost = self.current_cost
+            self.turns_improved = 0
+            self.improvements += 1
+            return True
+        self.turns_improved += 1
+        return False
+
+    def stats(self):
+        return {'start_cost': self.start_cost, 'best_cost': self.best_solution_cost, 'iterations': self.iteration,
+                'improvements': self.improvements, 'seconds': self.seconds}
+
+    def save(self, path):
+        """Writes the state with the cities and the settings it was searched with, through a temporary file so an
+        interrupted write keeps the previous checkpoint."""
+        tabu = self.tabu
+        state = {'cities': self.instance.cities, 'settings': self.instance.settings,
+                 'current_solution': self.current_solution, 'current_cost': self.current_cost,
+                 'best_solution': self.best_solution, 'best_solution_cost': self.best_solution_cost,
+                 'start_cost': self.start_cost, 'iteration': self.iteration, 'improvements': self.improvements,
+                 'turns_improved': self.turns_improved, 'seconds': self.seconds, 'finished': self.finished,
+                 'dont_look': self.dont_look,
+                 'tabu': {'kind': tabu.kind, 'tenure': tabu.tenure, 'moves': tabu.moves, 'city_until': tabu.city_until,
+                          'key_until': [[list(key), stamp] for key, stamp in tabu.key_until.items()]}}
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, instance):
+        """The state saved in ``path`` for ``instance``. Raises ValueError when its cities or settings differ from
+        the ones the state was saved with."""
+        with open(path) as f:
+            saved = json.load(f)
+        if saved['cities'] != [list(city) for city in instance.cities] or saved['settings'] != instance.settings:
+            raise ValueError(f'Checkpoint "{path}" was saved for other cities or settings')
+        state = cls(instance, saved['current_solution'])
+        for name in ('current_cost', 'best_solution', 'best_solution_cost', 'start_cost', 'iteration',
+                     'improvements', 'turns_improved', 'seconds', 'finished', 'dont_look'):
+            setattr(state, name, saved[name])
+        tabu = saved['tabu']
+        state.tabu = TabuMemory(tabu['tenure'], tabu['kind'], instance.n_cities)
+        state.tabu.moves = tabu['moves']
+        state.tabu.city_until = tabu['city_until']
+        state.tabu.key_until = {tuple(key): stamp for key, stamp in tabu['key_until']}
+        return state
+
+
+def tabu_search(instance, tour, iterations=None, verbose=True):
+    """Tabu search over ``instance`` from ``tour``, until ``iterations`` (max_iterations of the instance by default)
+    or improve_thresh iterations without improvement. Returns (best tour, its cost, stats)."""
+    begin_time = timeit.default_timer()
+    iterations = instance.max_iterations if iterations is None else iterations
+    state = SearchState(instance, tour)
+    while state.iteration < iterations and not state.finished:
+        state.step()
+        if verbose and not state.finished:
+            print("Iteration {}: Best solution cost = {}".format(state.iteration - 1, state.best_solution_cost))
+    state.seconds = timeit.default_timer() - begin_time
+    return state.best_solution, state.best_solution_cost, state.stats()
+
+
+def solve(cities, params=None, time_budget=None, checkpoint=None, checkpoint_every=1000, resume=False,
+          verbose=False, seed=None):
+    """Anytime tabu search over ``cities`` with ``params`` overriding the default SETTINGS, every call starts from
+    the defaults and keeps its instance to itself. Yields (best tour, its cost, stats) for the starting tour and
+    then for every better tour found, until max_iterations, improve_thresh iterations without improvement or
+    ``time_budget`` seconds of wall clock. With ``checkpoint`` the whole state is written to that file every
+    ``checkpoint_every`` iterations and when the search stops, with ``resume`` the search goes on from the file if
+    there is one. The starting tour is made as set in ``initial_tour``, ``seed`` only matters to a random one.
+    Prints every iteration only when ``verbose``."""
+    begin_time = timeit.default_timer()
+    instance = Instance(cities, params)
+    if resume and checkpoint is not None and os.path.exists(checkpoint):
+        state = SearchState.load(checkpoint, instance)
+    else:
+        rnd = random if seed is None else random.Random(seed)
+        state = SearchState(instance, instance.initial_solution(rnd=rnd))
+    seconds = state.seconds
+    yield state.best_solution[:], state.best_solution_cost, state.stats()
+
+    try:
+        while state.iteration < instance.max_iterations and not state.finished:
+            now = timeit.default_timer()
+            if time_budget is not None and now - begin_time >= time_budget:
+                break
+            improved = state.step()
+            state.seconds = seconds + timeit.default_timer() - begin_time
+            if verbose and not state.finished:
+                print("Iteration {}: Best solution cost = {}".format(state.iteration - 1, state.best_solution_cost))
+            if checkpoint is not None and state.iteration % checkpoint_every == 0:
+                state.save(checkpoint)
+            if improved:
+                yield state.best_solution[:], state.best_solution_cost, state.stats()
+    finally:
+        state.seconds = seconds + timeit.default_timer() - begin_time
+        if checkpoint is not None:
+            state.save(checkpoint)
 
-    print("Iteration {}: Best solution cost = {}".format(iteration, best_solution_cost))
+if __name__ == '__main__':
+    for best_solution, best_solution_cost, _ in solve(random_cities(n_cities), verbose=True):
+        pass
 
-print("Best solution: {}".format(best_solution))
-print("Best solution cost: {}".format(best_solution_cost))
+    print("Best solution: {}".format(best_solution))
+    print("Best solution cost: {}".format(best_solution_cost))
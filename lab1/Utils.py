@@ -1,9 +1,20 @@
 from datetime import datetime, time, date
-from typing import Dict, List, Tuple, Set, Optional
+from typing import Dict, List, Tuple, Set, Optional, Iterable, Callable, Sequence
 import csv
 from enum import Enum
 from queue import PriorityQueue
 import heapq
+from array import array
+from bisect import bisect_left, bisect_right
+import hashlib
+import json
+import os
+import struct
+import sys
+import threading
+import timeit
+import weakref
+from multiprocessing import shared_memory
 
 indice_id = 0
 indice_company = 1
@@ -17,30 +28,26 @@ indice_start_lon = 8
 indice_end_lat = 9
 indice_end_lon = 10
 
+SECONDS_IN_DAY = 24 * 3600
+
+SNAPSHOT_MAGIC = b'LAB1TT'
+SNAPSHOT_VERSION = 2
+
 
 class Criteria(Enum):
     t = 0
     p = 1
 
 
-def clear_row(row: list) -> list:
-    bad_time1: str = row[indice_departure_time]
-    bad_time2: str = row[indice_arrival_time]
-    bad_time1 = str((int(bad_time1[0:2]) % 24)) + bad_time1[2:]
-    bad_time2 = str((int(bad_time2[0:2]) % 24)) + bad_time2[2:]
-    return [*row[:indice_departure_time], bad_time1, bad_time2, *row[indice_arrival_time + 1:]]
-
-
 def load_csv(filename: str = 'connection_graph.csv') -> List[tuple]:
     with open(filename, newline='', encoding='utf-8') as f:
         next(f)
         reader = csv.reader(f, delimiter=',')
         data = []
         for row in reader:
-            row = clear_row(row)
             data.append((int(row[indice_id]), str(row[indice_company]), str(row[indice_line]),
-                         datetime.strptime(row[indice_departure_time], '%H:%M:%S').time(),
-                         datetime.strptime(row[indice_arrival_time], '%H:%M:%S').time(), str(row[indice_start]),
+                         sec_to_time(parse_sec(row[indice_departure_time])),
+                         sec_to_time(parse_sec(row[indice_arrival_time])), str(row[indice_start]),
                          str(row[indice_end]),
                          float(row[indice_start_lat]), float(row[indice_start_lon]), float(row[indice_end_lat]),
                          float(row[indice_end_lon])))
@@ -48,6 +55,8 @@ def load_csv(filename: str = 'connection_graph.csv') -> List[tuple]:
 
 
 class Node:
+    __slots__ = ('name', 'lat', 'lon')
+
     def __init__(self, name: str, latitude: float, lontitude: float):
         self.name = name
         self.lat = latitude
@@ -61,6 +70,8 @@ class Node:
 
 
 class Edge:
+    __slots__ = ('start', 'stop', 'line', 'departure_time', 'arrival_time', 'cost')
+
     def __init__(self, start: str, end: str, line: str, departure_time: time,
                  arrival_time: time):
         self.start: str = start
@@ -68,16 +79,10 @@ class Edge:
         self.line: str = line
         self.departure_time = departure_time
         self.arrival_time = arrival_time
-        self._time_since_time_zero = None
         self.cost = calc_sec(departure_time, arrival_time)
 
-    def clear_time_since_zero(self):
-        self._time_since_time_zero = None
-
     def time_since_time_zero(self, time_zero: time):
-        if self._time_since_time_zero is None:
-            self._time_since_time_zero = calc_sec(time_zero, self.departure_time)
-        return self._time_since_time_zero
+        return calc_sec(time_zero, self.departure_time)
 
     def __lt__(self, other):
         return self.departure_time < other.departure_time
@@ -99,59 +104,903 @@ class Edge:
 #         self.edges.add(edge)
 
 
-class Graph:
-    def __init__(self, csv_data: List[Tuple]):
-        self.lines: Dict[str, Dict[str, Dict[str, List[Edge]]]] = {} # line : Dict[start_node: [end_node, edges]]
-        self.nodes: Dict[str, Node] = {}
-        self._build_graph(csv_data)
-        self._sort_edges()
-
-    def clear_time_since_zero(self):
-        for nodes in self.lines.values():
-            for node in nodes.values():
-                for edges in node.values():
-                    for edge in edges:
-                        edge.clear_time_since_zero()
-
-    def _build_graph(self, csv_data: List[Tuple]):
+class Timetable:
+    """Columnar store of all connections. Connection ``i`` is described by the i-th entry of every column,
+    stops and lines are interned to dense ints, times are seconds since midnight."""
+
+    def __init__(self, csv_data: Optional[List[Tuple]] = None):
+        self.stops: List[Node] = []  # stop id : Node
+        self.stop_ids: Dict[str, int] = {}
+        self.line_names: List[str] = []  # line id : line name
+        self.line_ids: Dict[str, int] = {}
+
+        self.ids = array('q')
+        self.start = array('i')
+        self.end = array('i')
+        self.line = array('i')
+        self.departure = array('i')
+        self.arrival = array('i')
+        if csv_data is not None:
+            self._build_columns(csv_data)
+
+    @classmethod
+    def from_csv(cls, filename: str = 'connection_graph.csv') -> 'Timetable':
+        """Parses the CSV column by column straight into the columns, without building rows or datetime objects.
+        The times are converted a whole column at a time, the coordinates of a stop only where it first appears."""
+        timetable = cls()
+        with open(filename, newline='', encoding='utf-8') as f:
+            header = next(f)
+            text = f.read()
+        n_fields = len(header.split(','))
+        if '"' in text:
+            columns = list(zip(*csv.reader(text.splitlines(), delimiter=',')))
+        else:
+            # Without quoting every field is between commas, the columns are slices of one split of the whole file
+            fields = text.replace('\r\n', '\n').rstrip('\n').replace('\n', ',').split(',') if text.strip() else []
+            if len(fields) % n_fields:
+                raise ValueError(f'Rows of "{filename}" do not all have {n_fields} fields')
+            columns = [fields[i::n_fields] for i in range(n_fields)] if fields else []
+        if not columns:
+            return timetable
+        starts, ends = columns[indice_start], columns[indice_end]
+        # Stops are numbered in order of appearance, the start of a row before its end
+        names = [name for pair in zip(starts, ends) for name in pair]
+        first_seen = dict(zip(reversed(names), range(len(names) - 1, -1, -1)))
+        for name in dict.fromkeys(names):
+            row, is_end = divmod(first_seen[name], 2)
+            lat, lon = (indice_end_lat, indice_end_lon) if is_end else (indice_start_lat, indice_start_lon)
+            timetable._intern_stop(name, float(columns[lat][row]), float(columns[lon][row]))
+        for name in dict.fromkeys(columns[indice_line]):
+            timetable._intern_line(name)
+
+        timetable.ids = array('q', map(int, columns[indice_id]))
+        timetable.start = array('i', map(timetable.stop_ids.__getitem__, starts))
+        timetable.end = array('i', map(timetable.stop_ids.__getitem__, ends))
+        timetable.line = array('i', map(timetable.line_ids.__getitem__, columns[indice_line]))
+        timetable.departure = parse_sec_column(columns[indice_departure_time])
+        timetable.arrival = parse_sec_column(columns[indice_arrival_time])
+        return timetable
+
+    def __len__(self):
+        return len(self.departure)
+
+    def _intern_stop(self, name: str, lat: float, lon: float) -> int:
+        stop_id = self.stop_ids.get(name)
+        if stop_id is None:
+            stop_id = len(self.stops)
+            self.stop_ids[name] = stop_id
+            self.stops.append(Node(name, lat, lon))
+        return stop_id
+
+    def _intern_line(self, name: str) -> int:
+        line_id = self.line_ids.get(name)
+        if line_id is None:
+            line_id = len(self.line_names)
+            self.line_ids[name] = line_id
+            self.line_names.append(name)
+        return line_id
+
+    def _build_columns(self, csv_data: List[Tuple]):
         for row in csv_data:
-            start: str = row[indice_start]
-            end: str = row[indice_end]
-            line: str = row[indice_line]
-            start_departure: datetime.time = row[indice_departure_time]
-            end_arrival: datetime.time = row[indice_arrival_time]
+            self.ids.append(row[indice_id])
+            self.start.append(self._intern_stop(row[indice_start], row[indice_start_lat], row[indice_start_lon]))
+            self.end.append(self._intern_stop(row[indice_end], row[indice_end_lat], row[indice_end_lon]))
+            self.line.append(self._intern_line(row[indice_line]))
+            self.departure.append(time_to_sec(row[indice_departure_time]))
+            self.arrival.append(time_to_sec(row[indice_arrival_time]))
+
+    def cost(self, connection: int) -> int:
+        return (self.arrival[connection] - self.departure[connection]) % SECONDS_IN_DAY
+
+    def edge(self, connection: int) -> Edge:
+        return Edge(self.stops[self.start[connection]].name, self.stops[self.end[connection]].name,
+                    self.line_names[self.line[connection]], sec_to_time(self.departure[connection]),
+                    sec_to_time(self.arrival[connection]))
+
+
+class Graph:
+    def __init__(self, csv_data: Optional[List[Tuple]] = None, timetable: Optional[Timetable] = None,
+                 adjacency: Optional[List[List[Tuple[int, int, array, array, bool]]]] = None):
+        self.timetable = timetable if timetable is not None else Timetable(csv_data)
+        self.nodes: Dict[str, Node] = {node.name: node for node in self.timetable.stops}
+        # start stop id : [(end stop id, line id, connections sorted by departure, their departures,
+        #                   whether one of them arrives before one departing earlier)]
+        self.adjacency: List[List[Tuple[int, int, array, array, bool]]] = []
+        self._lines: Optional[Dict[str, Dict[str, Dict[str, List[Edge]]]]] = None
+        self._scan_order: Optional[Tuple[array, array]] = None
+        self._adjacency_by_line: Optional[List[Dict[int, List[Tuple[int, int, array, array, bool]]]]] = None
+        self._connection_index: Optional[Dict[int, int]] = None
+        self.landmarks: Optional[Landmarks] = None
+        if adjacency is not None:
+            self.adjacency = adjacency
+        else:
+            self._build_graph()
+
+    @classmethod
+    def from_csv(cls, filename: str = 'connection_graph.csv', use_snapshot: bool = True,
+                 verify_hash: bool = True) -> 'Graph':
+        """Builds the graph from the CSV, reusing the binary snapshot stored next to it while it is up to date.
+        The snapshot is rebuilt when the size, mtime or content hash of the CSV changes. ``verify_hash=False`` skips
+        hashing the CSV on load and trusts size and mtime alone."""
+        if not use_snapshot:
+            return cls(timetable=Timetable.from_csv(filename))
+        snapshot = snapshot_path(filename)
+        graph = cls.load_snapshot(snapshot, filename, verify_hash)
+        if graph is None:
+            graph = cls(timetable=Timetable.from_csv(filename))
+            try:
+                graph.save_snapshot(snapshot, filename)
+            except OSError as e:
+                print(f'Could not write timetable snapshot "{snapshot}": {e}', file=sys.stderr)
+        return graph
+
+    def save_snapshot(self, path: str, source: str) -> None:
+        """Writes the columns and the adjacency index as raw arrays behind a JSON header describing them."""
+        columns = self._columns()
+        header = {'source': _source_fingerprint(source, with_hash=True), 'byteorder': sys.byteorder,
+                  **self._layout(columns)}
+        header_bytes = json.dumps(header).encode('utf-8')
+
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(SNAPSHOT_MAGIC)
+            f.write(struct.pack('<IQ', SNAPSHOT_VERSION, len(header_bytes)))
+            f.write(header_bytes)
+            for column in columns.values():
+                column.tofile(f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load_snapshot(cls, path: str, source: str, verify_hash: bool = True) -> Optional['Graph']:
+        """Returns the graph stored in the snapshot, or None if it is missing, of another version or stale."""
+        try:
+            with open(path, 'rb') as f:
+                if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                    return None
+                version, header_length = struct.unpack('<IQ', f.read(struct.calcsize('<IQ')))
+                if version != SNAPSHOT_VERSION:
+                    return None
+                header = json.loads(f.read(header_length).decode('utf-8'))
+                stored = header['source']
+                current = _source_fingerprint(source, with_hash=verify_hash)
+                if stored['size'] != current['size'] or stored['mtime_ns'] != current['mtime_ns'] \
+                        or (verify_hash and stored['sha1'] != current['sha1']) or header['byteorder'] != sys.byteorder:
+                    return None
+                columns = {}
+                for name, typecode, itemsize, length in header['columns']:
+                    column = array(typecode)
+                    if column.itemsize != itemsize:
+                        return None
+                    column.fromfile(f, length)
+                    columns[name] = column
+        except (OSError, EOFError, ValueError, KeyError, struct.error):
+            return None
+        return cls._from_columns(header, columns)
+
+    def share(self) -> Tuple[shared_memory.SharedMemory, dict]:
+        """Copies the columns and the adjacency index into one block of shared memory, so that worker processes
+        map them with ``attach`` instead of each holding a copy of the graph. Returns the block, to be closed and
+        unlinked by the caller once the workers are done, and its layout for ``attach``."""
+        columns = self._columns()
+        layout = self._layout(columns)
+        offsets = []
+        size = 0
+        for column in columns.values():
+            # Every column starts 8 byte aligned
+            size = -(-size // 8) * 8
+            offsets.append(size)
+            size += column.itemsize * len(column)
+        memory = shared_memory.SharedMemory(create=True, size=max(1, size))
+        for column, offset in zip(columns.values(), offsets):
+            memory.buf[offset:offset + column.itemsize * len(column)] = column.tobytes()
+        layout['offsets'] = offsets
+        return memory, layout
+
+    @classmethod
+    def attach(cls, memory: shared_memory.SharedMemory, layout: dict) -> 'Graph':
+        """Graph reading the columns and the adjacency index in place from a block made by ``share``, as
+        memoryviews. The block has to stay open while the graph is used and the graph must not be changed,
+        e.g. by ``apply_delays``."""
+        columns = {name: memory.buf[offset:offset + itemsize * length].cast(typecode)
+                   for (name, typecode, itemsize, length), offset in zip(layout['columns'], layout['offsets'])}
+        return cls._from_columns(layout, columns)
+
+    def _columns(self) -> Dict[str, array]:
+        """The timetable columns and the adjacency index flattened into arrays, as snapshots and ``share`` store
+        them."""
+        timetable = self.timetable
+        group_stops = array('i', [0])
+        group_ends, group_lines, group_overtaking = array('i'), array('i'), array('b')
+        group_offsets = array('i', [0])
+        group_connections, group_departures = array('i'), array('i')
+        for groups in self.adjacency:
+            for end, line, connections, departures, overtaking in groups:
+                group_ends.append(end)
+                group_lines.append(line)
+                group_overtaking.append(overtaking)
+                group_connections.extend(connections)
+                group_departures.extend(departures)
+                group_offsets.append(len(group_connections))
+            group_stops.append(len(group_ends))
+        return {'ids': timetable.ids, 'start': timetable.start, 'end': timetable.end, 'line': timetable.line,
+                'departure': timetable.departure, 'arrival': timetable.arrival, 'group_stops': group_stops,
+                'group_ends': group_ends, 'group_lines': group_lines, 'group_overtaking': group_overtaking,
+                'group_offsets': group_offsets,
+                'group_connections': group_connections, 'group_departures': group_departures}
+
+    def _layout(self, columns: Dict[str, array]) -> dict:
+        timetable = self.timetable
+        return {'stops': [(node.name, node.lat, node.lon) for node in timetable.stops],
+                'lines': timetable.line_names,
+                'columns': [(name, column.typecode, column.itemsize, len(column)) for name, column in columns.items()]}
+
+    @classmethod
+    def _from_columns(cls, layout: dict, columns: Dict[str, array]) -> 'Graph':
+        timetable = Timetable()
+        for name, lat, lon in layout['stops']:
+            timetable._intern_stop(name, lat, lon)
+        for name in layout['lines']:
+            timetable._intern_line(name)
+        for name in ('ids', 'start', 'end', 'line', 'departure', 'arrival'):
+            setattr(timetable, name, columns[name])
+
+        group_stops, group_offsets = columns['group_stops'], columns['group_offsets']
+        group_ends, group_lines = columns['group_ends'], columns['group_lines']
+        group_overtaking = columns['group_overtaking']
+        group_connections, group_departures = columns['group_connections'], columns['group_departures']
+        adjacency = []
+        for stop in range(len(group_stops) - 1):
+            adjacency.append([(group_ends[group], group_lines[group],
+                               group_connections[group_offsets[group]:group_offsets[group + 1]],
+                               group_departures[group_offsets[group]:group_offsets[group + 1]],
+                               bool(group_overtaking[group]))
+                              for group in range(group_stops[stop], group_stops[stop + 1])])
+        return cls(timetable=timetable, adjacency=adjacency)
+
+    @property
+    def lines(self) -> Dict[str, Dict[str, Dict[str, List[Edge]]]]:
+        """Per-line view of the timetable built out of Edge objects. Materialized on first use only."""
+        if self._lines is None:
+            self._lines = self._build_lines()
+        return self._lines
+
+    @property
+    def scan_order(self) -> Tuple[array, array]:
+        """All connections sorted by departure (then arrival) together with their departures, for connection scans."""
+        if self._scan_order is None:
+            timetable = self.timetable
+            departure, arrival = timetable.departure, timetable.arrival
+            connections = sorted(range(len(timetable)), key=lambda c: (departure[c], arrival[c]))
+            self._scan_order = (array('i', connections), array('i', (departure[c] for c in connections)))
+        return self._scan_order
+
+    @property
+    def adjacency_by_line(self) -> List[Dict[int, List[Tuple[int, int, array, array, bool]]]]:
+        """The adjacency groups of every stop keyed by their line, for searches that stay on one line."""
+        if self._adjacency_by_line is None:
+            by_line = []
+            for groups in self.adjacency:
+                lines: Dict[int, List[Tuple[int, int, array, array, bool]]] = {}
+                for group in groups:
+                    lines.setdefault(group[1], []).append(group)
+                by_line.append(lines)
+            self._adjacency_by_line = by_line
+        return self._adjacency_by_line
+
+    @property
+    def connection_index(self) -> Dict[int, int]:
+        """CSV id : connection."""
+        if self._connection_index is None:
+            self._connection_index = {connection_id: connection
+                                      for connection, connection_id in enumerate(self.timetable.ids)}
+        return self._connection_index
+
+    def apply_delays(self, updates: Iterable[Tuple[int, time, time]]) -> int:
+        """Moves connections, given by their CSV id, to a new departure and arrival time in place. Each one is
+        re-inserted into its adjacency group, and into the scan order if that was built, so both stay sorted by
+        departure. A new running time can make a connection overtake or stop overtaking others of its group, so
+        the overtaking flag of every group changed is checked again. The Edge view, if built, is updated the same
+        way and the landmarks are recomputed only if a connection became faster than the bound they were computed
+        from. Searches started afterwards see the new times. Returns the number of connections moved."""
+        timetable = self.timetable
+        departure, arrival = timetable.departure, timetable.arrival
+        connection_index = self.connection_index
+        # All ids are resolved first, an unknown one raises KeyError before anything is changed
+        changes = [(connection_index[connection_id], time_to_sec(new_departure), time_to_sec(new_arrival))
+                   for connection_id, new_departure, new_arrival in updates]
+
+        found_groups: Dict[Tuple[int, int, int], Tuple[int, int, array, array, bool]] = {}
+        landmarks_stale = False
+        for connection, new_departure, new_arrival in changes:
+            start, end, line = timetable.start[connection], timetable.end[connection], timetable.line[connection]
+            group = found_groups.get((start, end, line))
+            if group is None:
+                group = found_groups[start, end, line] = next(
+                    group for group in self.adjacency[start] if group[0] == end and group[1] == line)
+            old_position, new_position = _move(group[2], group[3], connection, departure[connection], new_departure)
+            if self._scan_order is not None:
+                connections, departures = self._scan_order
+                position = bisect_left(departures, departure[connection])
+                while connections[position] != connection:
+                    position += 1
+                connections.pop(position)
+                departures.pop(position)
+                position, end_position = bisect_left(departures, new_departure), bisect_right(departures, new_departure)
+                while position < end_position and arrival[connections[position]] < new_arrival:
+                    position += 1
+                connections.insert(position, connection)
+                departures.insert(position, new_departure)
+            departure[connection] = new_departure
+            arrival[connection] = new_arrival
+            if self._lines is not None:
+                edges = self._lines[timetable.line_names[line]][timetable.stops[start].name][timetable.stops[end].name]
+                edges.pop(old_position)
+                edges.insert(new_position, timetable.edge(connection))
+            if self.landmarks is not None and \
+                    timetable.cost(connection) < self.landmarks.pair_costs[start].get(end, SECONDS_IN_DAY):
+                landmarks_stale = True
+
+        for (start, end, line), group in found_groups.items():
+            overtaking = overtakes(group[2], group[3], arrival)
+            if overtaking != group[4]:
+                self._replace_group(start, group, group[:4] + (overtaking,))
+
+        if landmarks_stale:
+            self.preprocess_landmarks(len(self.landmarks.landmarks))
+        return len(changes)
+
+    def _replace_group(self, start: int, group: Tuple[int, int, array, array, bool],
+                       new_group: Tuple[int, int, array, array, bool]) -> None:
+        """Puts ``new_group`` in place of ``group`` among the groups of ``start``, also in the by-line view if built."""
+        views = [self.adjacency[start]]
+        if self._adjacency_by_line is not None:
+            views.append(self._adjacency_by_line[start][group[1]])
+        for groups in views:
+            groups[next(position for position, other in enumerate(groups) if other is group)] = new_group
+
+    def preprocess_landmarks(self, count: int = 8) -> 'Landmarks':
+        """Computes the lower bounds used by the ``Landmarks`` A* heuristic, keeps them in ``self.landmarks``."""
+        self.landmarks = Landmarks(self, count)
+        return self.landmarks
+
+    def _build_graph(self):
+        timetable = self.timetable
+        grouped: List[Dict[int, Dict[int, List[int]]]] = [{} for _ in timetable.stops]
+        for connection in range(len(timetable)):
+            grouped[timetable.start[connection]].setdefault(timetable.end[connection], {}) \
+                .setdefault(timetable.line[connection], []).append(connection)
+
+        departure, arrival = timetable.departure, timetable.arrival
+        for neighbours in grouped:
+            groups = []
+            for end, lines in neighbours.items():
+                for line, connections in lines.items():
+                    connections.sort(key=departure.__getitem__)
+                    connections = array('i', connections)
+                    departures = array('i', (departure[connection] for connection in connections))
+                    groups.append((end, line, connections, departures, overtakes(connections, departures, arrival)))
+            self.adjacency.append(groups)
+
+    def _build_lines(self) -> Dict[str, Dict[str, Dict[str, List[Edge]]]]:
+        timetable = self.timetable
+        lines: Dict[str, Dict[str, Dict[str, List[Edge]]]] = {}  # line : Dict[start_node: [end_node, edges]]
+        for start, groups in enumerate(self.adjacency):
+            for end, line, connections, _, _ in groups:
+                nodes = lines.setdefault(timetable.line_names[line], {})
+                start_name = timetable.stops[start].name
+                end_name = timetable.stops[end].name
+                nodes.setdefault(end_name, {})
+                nodes.setdefault(start_name, {})[end_name] = [timetable.edge(connection) for connection in connections]
+        return lines
+
+
+def _move(connections: array, departures: array, connection: int, old_departure: int,
+          new_departure: int) -> Tuple[int, int]:
+    """Re-inserts ``connection`` at ``new_departure`` into a group kept sorted by departure, returns its old and new
+    position."""
+    position = bisect_left(departures, old_departure)
+    while connections[position] != connection:
+        position += 1
+    connections.pop(position)
+    departures.pop(position)
+    new_position = bisect_right(departures, new_departure)
+    connections.insert(new_position, connection)
+    departures.insert(new_position, new_departure)
+    return position, new_position
+
+
+def first_departure(departures: array, time_zero: int, curr_cost: int) -> int:
+    """Index of the first of the sorted ``departures`` that can be caught ``curr_cost`` seconds after ``time_zero``,
+    departures earlier than ``time_zero`` belong to the next day. Returns -1 if none can be caught."""
+    target = time_zero + curr_cost
+    if target < SECONDS_IN_DAY:
+        idx = bisect_left(departures, target)
+        if idx < len(departures):
+            return idx
+        return 0 if departures[0] < time_zero else -1
+    idx = bisect_left(departures, target - SECONDS_IN_DAY)
+    if idx < len(departures) and departures[idx] < time_zero:
+        return idx
+    return -1
+
+
+def earliest_arrival(connections: array, departures: array, arrival: array, time_zero: int, curr_cost: int,
+                     idx: int) -> int:
+    """Index of the connection arriving first among the ones that can be caught ``curr_cost`` seconds after
+    ``time_zero``, for a group in which connections overtake each other. ``idx`` is the first of them as returned by
+    ``first_departure``, the following ones are scanned in order of departure, over midnight too, until one departs
+    no earlier than the best arrival so far."""
+    n = len(departures)
+    best = idx
+    best_cost = (departures[idx] - time_zero) % SECONDS_IN_DAY \
+        + (arrival[connections[idx]] - departures[idx]) % SECONDS_IN_DAY
+    position = idx
+    for _ in range(n - 1):
+        position = position + 1 if position + 1 < n else 0
+        time_since_zero = (departures[position] - time_zero) % SECONDS_IN_DAY
+        # Wrapping around reaches the departures that can no longer be caught
+        if time_since_zero < curr_cost or time_since_zero >= best_cost:
+            break
+        cost = time_since_zero + (arrival[connections[position]] - departures[position]) % SECONDS_IN_DAY
+        if cost < best_cost:
+            best, best_cost = position, cost
+    return best
+
+
+def overtakes(connections: array, departures: array, arrival: array) -> bool:
+    """Whether a connection of a group sorted by departure arrives before one that departs earlier, counting from
+    any time of day, so the last departure of a day arriving after the first one of the next day overtakes too.
+    The first connection caught from such a group need not be the best one, see ``earliest_arrival``."""
+    if not connections:
+        return False
+    previous = -1
+    for connection, departure in zip(connections, departures):
+        reach = departure + (arrival[connection] - departure) % SECONDS_IN_DAY
+        if reach < previous:
+            return True
+        previous = reach
+    return previous > departures[0] + (arrival[connections[0]] - departures[0]) % SECONDS_IN_DAY + SECONDS_IN_DAY
+
+
+class Landmarks:
+    """ALT lower bounds. Ignoring waiting, the fastest connection between two stops is a time independent lower
+    bound on the time it takes to get from one to the other. Static travel times to and from a few landmark stops
+    then bound every query by the triangle inequality, e.g. d(v, goal) >= d(v, L) - d(goal, L).
+    Used directly as the A* heuristic, it returns seconds."""
+    UNREACHABLE = -1
+
+    def __init__(self, graph: 'Graph', count: int = 8):
+        self.stop_ids = graph.timetable.stop_ids
+        timetable = graph.timetable
+        forward: List[Dict[int, int]] = [{} for _ in timetable.stops]
+        backward: List[Dict[int, int]] = [{} for _ in timetable.stops]
+        for start, groups in enumerate(graph.adjacency):
+            for end, line, connections, departures, _ in groups:
+                cost = min((timetable.arrival[connection] - departure) % SECONDS_IN_DAY
+                           for connection, departure in zip(connections, departures))
+                if cost < forward[start].get(end, SECONDS_IN_DAY):
+                    forward[start][end] = cost
+                    backward[end][start] = cost
+
+        # The bounds hold while no connection is faster than these
+        self.pair_costs = forward
+        self.landmarks: List[int] = []
+        self.to_landmark: List[array] = []  # d(stop, landmark)
+        self.from_landmark: List[array] = []  # d(landmark, stop)
+        # Farthest point selection, each landmark is the stop farthest from the ones picked so far
+        closest = [float('inf')] * len(timetable.stops)
+        candidate = 0
+        for _ in range(min(count, len(timetable.stops))):
+            self.landmarks.append(candidate)
+            self.from_landmark.append(self._static_dijkstra(forward, candidate))
+            self.to_landmark.append(self._static_dijkstra(backward, candidate))
+            for stop, distance in enumerate(self.from_landmark[-1]):
+                if distance != self.UNREACHABLE and distance < closest[stop]:
+                    closest[stop] = distance
+            candidate = max(range(len(closest)), key=lambda stop: (closest[stop] != float('inf'), closest[stop]))
+
+    @classmethod
+    def _static_dijkstra(cls, adjacency: List[Dict[int, int]], source: int) -> array:
+        costs = array('i', [cls.UNREACHABLE]) * len(adjacency)
+        pq = [(0, source)]
+        while pq:
+            cost, node = heapq.heappop(pq)
+            if costs[node] != cls.UNREACHABLE:
+                continue
+            costs[node] = cost
+            for neighbour, edge_cost in adjacency[node].items():
+                if costs[neighbour] == cls.UNREACHABLE:
+                    heapq.heappush(pq, (cost + edge_cost, neighbour))
+        return costs
+
+    def lower_bound(self, stop: int, goal: int) -> int:
+        best = 0
+        unreachable = self.UNREACHABLE
+        for to_landmark, from_landmark in zip(self.to_landmark, self.from_landmark):
+            stop_to, goal_to = to_landmark[stop], to_landmark[goal]
+            if stop_to != unreachable and goal_to != unreachable and stop_to - goal_to > best:
+                best = stop_to - goal_to
+            from_goal, from_stop = from_landmark[goal], from_landmark[stop]
+            if from_goal != unreachable and from_stop != unreachable and from_goal - from_stop > best:
+                best = from_goal - from_stop
+        return best
+
+    def __call__(self, a: Node, b: Node) -> float:
+        return self.lower_bound(self.stop_ids[a.name], self.stop_ids[b.name])
+
+
+class IndexedHeap:
+    """Binary min-heap over the items 0..capacity-1 with decrease-key. Every item is in the heap at most once,
+    so a search never pops stale entries and the heap stays no larger than the number of stops."""
+    __slots__ = ('items', 'priorities', 'positions', 'pushes', 'pops', 'decrease_keys', 'stale')
+
+    def __init__(self, capacity: int):
+        self.items: List[int] = []
+        self.priorities: list = [None] * capacity
+        self.positions: List[int] = [-1] * capacity
+        self.pushes = self.pops = self.decrease_keys = self.stale = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def clear(self) -> None:
+        for item in self.items:
+            self.positions[item] = -1
+        self.items.clear()
+        self.pushes = self.pops = self.decrease_keys = self.stale = 0
+
+    def push(self, item: int, priority) -> bool:
+        """Inserts the item or lowers its priority. Returns False if it is already queued with a priority no worse."""
+        position = self.positions[item]
+        if position < 0:
+            self.pushes += 1
+            self.priorities[item] = priority
+            position = len(self.items)
+            self.items.append(item)
+        elif priority < self.priorities[item]:
+            self.decrease_keys += 1
+            self.priorities[item] = priority
+        else:
+            return False
+        self._sift_up(position, item, priority)
+        return True
+
+    def pop(self) -> tuple:
+        """Removes the item with the lowest priority, returns (priority, item)."""
+        items = self.items
+        top = items[0]
+        last = items.pop()
+        if items:
+            self._sift_down(0, last, self.priorities[last])
+        self.positions[top] = -1
+        self.pops += 1
+        return self.priorities[top], top
+
+    def _sift_up(self, position: int, item: int, priority) -> None:
+        items, priorities, positions = self.items, self.priorities, self.positions
+        while position > 0:
+            parent_position = (position - 1) >> 1
+            parent = items[parent_position]
+            if not priority < priorities[parent]:
+                break
+            items[position] = parent
+            positions[parent] = position
+            position = parent_position
+        items[position] = item
+        positions[item] = position
+
+    def _sift_down(self, position: int, item: int, priority) -> None:
+        items, priorities, positions = self.items, self.priorities, self.positions
+        size = len(items)
+        while True:
+            child_position = 2 * position + 1
+            if child_position >= size:
+                break
+            child = items[child_position]
+            if child_position + 1 < size and priorities[items[child_position + 1]] < priorities[child]:
+                child_position += 1
+                child = items[child_position]
+            if not priorities[child] < priority:
+                break
+            items[position] = child
+            positions[child] = position
+            position = child_position
+        items[position] = item
+        positions[item] = position
+
+
+class LazyHeap:
+    """heapq with the interface of IndexedHeap. An improved item is pushed again and the outdated entries are
+    skipped when popped, ``stale`` counts them. Kept to measure what decrease-key saves, see the lazy_heap solvers
+    of benchmark.py."""
+    __slots__ = ('entries', 'best', 'pushes', 'pops', 'decrease_keys', 'stale')
+
+    def __init__(self, capacity: int = 0):
+        self.entries: list = []
+        self.best: dict = {}
+        self.pushes = self.pops = self.decrease_keys = self.stale = 0
+
+    def __len__(self):
+        return len(self.best)
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.best.clear()
+        self.pushes = self.pops = self.decrease_keys = self.stale = 0
+
+    def push(self, item: int, priority) -> bool:
+        if item in self.best and not priority < self.best[item]:
+            return False
+        self.best[item] = priority
+        self.pushes += 1
+        heapq.heappush(self.entries, (priority, item))
+        return True
+
+    def pop(self) -> tuple:
+        while True:
+            priority, item = heapq.heappop(self.entries)
+            if self.best.get(item) == priority:
+                del self.best[item]
+                self.pops += 1
+                return priority, item
+            self.stale += 1
+
+
+class SearchWorkspace:
+    """Per stop arrays reused by every query a thread runs on one graph. An entry only counts for the query whose
+    generation it is stamped with, so starting a query is O(1) instead of a pass over all stops."""
+    __slots__ = ('costs', 'edge_to_node', 'stamps', 'heap', 'lazy_heap', 'generation')
+
+    def __init__(self, n_stops: int):
+        self.costs: List[float] = [float('inf')] * n_stops
+        self.edge_to_node: List[int] = [-1] * n_stops
+        self.stamps: List[int] = [0] * n_stops  # generation that last wrote costs and edge_to_node
+        self.heap = IndexedHeap(n_stops)
+        self.lazy_heap = LazyHeap()
+        self.generation: int = 0
+
+
+_thread_workspaces = threading.local()
+
+
+def _workspace(graph: 'Graph') -> SearchWorkspace:
+    workspaces = getattr(_thread_workspaces, 'by_graph', None)
+    if workspaces is None:
+        workspaces = _thread_workspaces.by_graph = weakref.WeakKeyDictionary()
+    workspace = workspaces.get(graph)
+    if workspace is None or len(workspace.costs) != len(graph.timetable.stops):
+        workspace = workspaces[graph] = SearchWorkspace(len(graph.timetable.stops))
+    return workspace
+
+
+class QueryContext:
+    """Everything a single search writes to. The arrays come from the workspace of the calling thread, so many
+    queries with different start times can run over one shared Graph at once. A context stays valid until the
+    thread starts its next query on the same graph. ``goal`` is the stop a search ends at once it takes it off the
+    heap, as A* does, only the stats need it."""
+    __slots__ = ('time_zero', 'generation', 'costs', 'edge_to_node', 'stamps', 'heap', 'workspace', 'expanded',
+                 'stats')
+
+    def __init__(self, graph: Graph, time_zero: int, lazy_heap: bool = False, stats: Optional['SearchStats'] = None,
+                 goal: int = -1):
+        workspace = _workspace(graph)
+        workspace.generation += 1
+        self.time_zero: int = time_zero
+        self.generation: int = workspace.generation
+        self.costs: List[float] = workspace.costs
+        self.edge_to_node: List[int] = workspace.edge_to_node
+        self.stamps: List[int] = workspace.stamps
+        # The priority queue of the search, LazyHeap only to compare heap operations against
+        self.heap = workspace.lazy_heap if lazy_heap else workspace.heap
+        self.heap.clear()
+        self.workspace = workspace
+        self.expanded: int = 0
+        self.stats = stats
+        if stats is not None:
+            self.heap = TracingHeap(self.heap, stats, graph, time_zero, goal)
+
+    def time_since_time_zero(self, departure: int) -> int:
+        return (departure - self.time_zero) % SECONDS_IN_DAY
+
+    def reached(self, stop: int) -> bool:
+        return self.stamps[stop] == self.generation
+
+    def cost(self, stop: int) -> float:
+        return self.costs[stop] if self.stamps[stop] == self.generation else float('inf')
+
+    def set(self, stop: int, cost: float, connection: int) -> None:
+        self.stamps[stop] = self.generation
+        self.costs[stop] = cost
+        self.edge_to_node[stop] = connection
+
+
+class SearchStats:
+    """Opt-in tracing of one search, passed to ``dijkstra``/``astar`` as ``stats``. The search loops are not
+    touched, the counts are taken by a TracingHeap standing in for the heap of the query, so a query without stats
+    runs exactly the code it did before. ``on_expand(stop, cost)`` is called for every ``sample_every``-th stop
+    taken off the heap. Counts and phase times, in milliseconds, add up over all queries the stats are passed to."""
+    __slots__ = ('popped', 'expanded', 'edges_scanned', 'edges_departed', 'relaxations', 'stale', 'max_heap',
+                 'phases', 'on_expand', 'sample_every')
+
+    def __init__(self, on_expand: Optional[Callable[[int, float], None]] = None, sample_every: int = 1):
+        self.popped = self.expanded = self.edges_scanned = self.edges_departed = 0
+        self.relaxations = self.stale = self.max_heap = 0
+        self.phases: Dict[str, float] = {}
+        self.on_expand = on_expand
+        self.sample_every = sample_every
+
+    def phase(self, name: str) -> '_Phase':
+        return _Phase(self, name)
+
+    def finish(self, context: QueryContext) -> None:
+        self.expanded += context.expanded
+        heap = context.heap
+        self.stale += heap.heap.stale if isinstance(heap, TracingHeap) else 0
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__
+                if name not in ('on_expand', 'sample_every')}
+
+
+class _Phase:
+    __slots__ = ('stats', 'name', 'begin_time')
+
+    def __init__(self, stats: SearchStats, name: str):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.begin_time = timeit.default_timer()
+
+    def __exit__(self, *exc_info):
+        elapsed = (timeit.default_timer() - self.begin_time) * 1000
+        self.stats.phases[self.name] = self.stats.phases.get(self.name, 0.0) + elapsed
+
+
+class _NoPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NO_PHASE = _NoPhase()
+
+
+def phase(stats: Optional[SearchStats], name: str):
+    """Times a phase of the query into ``stats``, does nothing without stats."""
+    return _NO_PHASE if stats is None else stats.phase(name)
+
+
+class TracingHeap:
+    """Wraps the heap of a query for SearchStats. Every stop popped is about to be expanded, so its edges and the
+    ones that already departed are counted here from the cost it was popped with, which repeats the departure
+    lookups of the search. Priorities are the cost, or a tuple ending with it as in A*. The search stops at
+    ``goal`` when it pops it, so its edges are not counted."""
+    __slots__ = ('heap', 'stats', 'adjacency', 'time_zero', 'goal')
+
+    def __init__(self, heap, stats: SearchStats, graph: Graph, time_zero: int, goal: int = -1):
+        self.heap = heap
+        self.stats = stats
+        self.adjacency = graph.adjacency
+        self.time_zero = time_zero
+        self.goal = goal
+
+    def __len__(self):
+        return len(self.heap)
+
+    def clear(self) -> None:
+        self.heap.clear()
+
+    def push(self, item: int, priority) -> bool:
+        pushed = self.heap.push(item, priority)
+        if pushed:
+            stats = self.stats
+            stats.relaxations += 1
+            stats.max_heap = max(stats.max_heap, len(self.heap))
+        return pushed
+
+    def pop(self) -> tuple:
+        priority, item = self.heap.pop()
+        stats = self.stats
+        stats.popped += 1
+        cost = priority[-1] if isinstance(priority, tuple) else priority
+        if item != self.goal:
+            groups = self.adjacency[item]
+            stats.edges_scanned += len(groups)
+            stats.edges_departed += sum(first_departure(departures, self.time_zero, cost) < 0
+                                        for _, _, _, departures, _ in groups)
+        if stats.on_expand is not None and stats.popped % stats.sample_every == 0:
+            stats.on_expand(item, cost)
+        return priority, item
+
+
+def reconstruct_path(timetable: Timetable, context: QueryContext, start: int, goal: int) -> List[Edge]:
+    """Follows the connections used to reach each stop back from ``goal``. Empty if ``goal`` was not reached."""
+    path: List[Edge] = []
+    curr_node: int = goal
+    while curr_node != start:
+        if not context.reached(curr_node) or context.edge_to_node[curr_node] < 0:
+            return []
+        path.append(timetable.edge(context.edge_to_node[curr_node]))
+        curr_node = timetable.start[context.edge_to_node[curr_node]]
+    path.reverse()
+    return path
+
+
+def origin_path(timetable: Timetable, context: QueryContext, goal: int) -> Tuple[int, List[Edge]]:
+    """Like ``reconstruct_path`` for searches seeded from several stops, the walk back ends at whichever origin the
+    route starts from. Returns that origin and the path, (-1, []) if ``goal`` was not reached."""
+    if not context.reached(goal):
+        return -1, []
+    path: List[Edge] = []
+    curr_node: int = goal
+    while context.edge_to_node[curr_node] >= 0:
+        path.append(timetable.edge(context.edge_to_node[curr_node]))
+        curr_node = timetable.start[context.edge_to_node[curr_node]]
+    path.reverse()
+    return curr_node, path
+
+
+def snapshot_path(filename: str) -> str:
+    return filename + '.snapshot'
+
+
+def _source_fingerprint(filename: str, with_hash: bool) -> dict:
+    stat = os.stat(filename)
+    fingerprint = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha1': None}
+    if with_hash:
+        sha1 = hashlib.sha1()
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha1.update(chunk)
+        fingerprint['sha1'] = sha1.hexdigest()
+    return fingerprint
+
+
+def parse_sec(text: str) -> int:
+    """Converts HH:MM:SS to seconds since midnight, hours past 24 wrap around to the next day."""
+    hours, minutes, seconds = text.split(':')
+    return ((int(hours) % 24) * 60 + int(minutes)) * 60 + int(seconds)
 
-            edge = Edge(start, end, line, start_departure, end_arrival)
-            if line not in self.lines:
-                self.lines[line] = {}
-                
-            if start not in self.lines[line]:
-                self.lines[line][start] = {}
 
-            if end not in self.lines[line]:
-                self.lines[line][end] = {}
+def parse_sec_column(texts: Sequence[str]) -> array:
+    """``parse_sec`` of a whole column. When every time is written as HH:MM:SS the column is read as one block of
+    characters and converted with NumPy, other columns, or all of them when NumPy is not installed, go through
+    ``parse_sec`` one by one."""
+    try:
+        import numpy as np
+    except ImportError:
+        return array('i', map(parse_sec, texts))
+    joined = ''.join(texts)
+    if len(joined) == 8 * len(texts) and joined.isascii():
+        chars = np.frombuffer(joined.encode('ascii'), dtype=np.uint8).reshape(-1, 8)
+        digits = chars[:, [0, 1, 3, 4, 6, 7]].astype(np.int32) - ord('0')
+        if (chars[:, [2, 5]] == ord(':')).all() and ((digits >= 0) & (digits <= 9)).all():
+            seconds = (((digits[:, 0] * 10 + digits[:, 1]) % 24 * 60 + digits[:, 2] * 10 + digits[:, 3]) * 60
+                       + digits[:, 4] * 10 + digits[:, 5])
+            column = array('i')
+            column.frombytes(seconds.astype(np.intc).tobytes())
+            return column
+    return array('i', map(parse_sec, texts))
 
-            if end not in self.lines[line][start]:
-                self.lines[line][start][end] = []
 
-            self.lines[line][start][end].append(edge)
+def time_to_sec(t: time) -> int:
+    return (t.hour * 60 + t.minute) * 60 + t.second
 
-            if start not in self.nodes:
-                self.nodes[start] = Node(start, row[indice_start_lat], row[indice_start_lon])
-            if end not in self.nodes:
-                self.nodes[end] = Node(end, row[indice_end_lat], row[indice_end_lon])
 
-    def _sort_edges(self):
-        for line, nodes in self.lines.items():
-            for node, neighbours in nodes.items():
-                for neighbour, edges_to_neighbour in neighbours.items():
-                    edges_to_neighbour.sort()
+def sec_to_time(sec: int) -> time:
+    sec %= SECONDS_IN_DAY
+    return time(sec // 3600, sec % 3600 // 60, sec % 60)
 
 
 def calc_sec(start: datetime.time, end: datetime.time) -> int:
     start_sec = (start.hour * 60 + start.minute) * 60 + start.second
     end_sec = (end.hour * 60 + end.minute) * 60 + end.second
-    full_sec = 24 * 3600
+    full_sec = SECONDS_IN_DAY
     if start_sec > end_sec:
         diff = full_sec - (start_sec - end_sec)
         return diff
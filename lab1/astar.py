@@ -2,11 +2,40 @@ import heapq
 import math
 from Utils import *
 from datetime import time
-from typing import Callable, Dict, Tuple, List
+from typing import Callable, Dict, Tuple, List, Optional
 
+line_change_cost = 10
 
-def astar(graph: Graph, start: str, goal: str, time_zero: time, criteria: Criteria, heurestics: Callable) -> Tuple[float, List[Edge]]:
-    return _astar_shortest_path(graph, start, goal, time_zero, criteria, heurestics)
+
+def astar(graph: Graph, start: str, goal: str, time_zero: time, criteria: Criteria, heurestics: Callable,
+          ignore_times: bool = False, stats: Optional[SearchStats] = None) -> Tuple[float, List[Edge]]:
+    """Route by travel time (``Criteria.t``) or by the number of lines used (``Criteria.p``). The lines criteria
+    is answered by an exact bucket queue search that needs no heuristic. It only takes connections that can be
+    caught and returns the earliest arrival among routes with as few lines. With ``ignore_times`` it counts the
+    lines over the network regardless of departure times instead, a lower bound whose path need not be one that
+    can be travelled. The bucket search has no heap, ``stats`` only get its expanded stops and phase times."""
+    cost, path, _ = _astar_shortest_path(graph, start, goal, time_zero, criteria, heurestics, ignore_times,
+                                         stats)
+    return cost, path
+
+
+def astar_expanded(graph: Graph, start: str, goal: str, time_zero: time, criteria: Criteria, heurestics: Callable,
+                   ignore_times: bool = False,
+                   stats: Optional[SearchStats] = None) -> Tuple[float, List[Edge], int]:
+    """Same as ``astar``, also returns the number of stops expanded by the search."""
+    return _astar_shortest_path(graph, start, goal, time_zero, criteria, heurestics, ignore_times, stats)
+
+
+def astar_from(graph: Graph, origins: List[Tuple[str, int]], goal: str, time_zero: time,
+               heurestics: Callable) -> Tuple[float, Optional[str], List[Edge]]:
+    """Travel time A* seeded from several (stop, seconds needed to get there after ``time_zero``) origins at once,
+    see ``dijkstra_from``. Only the time criteria is supported."""
+    timetable = graph.timetable
+    goal_id = timetable.stop_ids[goal]
+    seeds = [(timetable.stop_ids[stop], offset) for stop, offset in origins]
+    context = _astar_time(graph, seeds, goal_id, QueryContext(graph, time_to_sec(time_zero)), heurestics)
+    origin, path = origin_path(timetable, context, goal_id)
+    return context.cost(goal_id), timetable.stops[origin].name if origin >= 0 else None, path
 
 
 def manhattan_distance(a: Node, b: Node) -> float:
@@ -36,95 +65,155 @@ def chebyshev_distance(a: Node, b: Node) -> float:
     return max(abs(a.lon - b.lon), abs(a.lat - b.lat))
 
 
-def _astar_shortest_path(graph: Graph, start: str, goal: str, time_zero: time, criteria: Criteria, heurestics: Callable) -> Tuple[float, List[Edge]]:
-    costs = None
-    edge_to_node = None
-
-    if criteria == Criteria.t:
-        costs, edge_to_node = _astar_time(graph, start, goal, time_zero, heurestics)
-    elif criteria == Criteria.p:
-        costs, edge_to_node = _astar_lines(graph, start, goal, time_zero, heurestics)
-
+def _astar_shortest_path(graph: Graph, start: str, goal: str, time_zero: time, criteria: Criteria, heurestics: Callable,
+                         ignore_times: bool = False,
+                         stats: Optional[SearchStats] = None) -> Tuple[float, List[Edge], int]:
+    timetable = graph.timetable
+    start_id = timetable.stop_ids[start]
+    goal_id = timetable.stop_ids[goal]
+
+    context = QueryContext(graph, time_to_sec(time_zero), stats=stats, goal=goal_id)
+    if criteria == Criteria.p:
+        with phase(stats, 'search'):
+            cost, path = _bucket_lines(graph, start_id, goal_id, context, ignore_times)
+    else:
+        with phase(stats, 'search'):
+            _astar_time(graph, [(start_id, 0)], goal_id, context, heurestics)
+        with phase(stats, 'path'):
+            cost, path = context.cost(goal_id), reconstruct_path(timetable, context, start_id, goal_id)
+    if stats is not None:
+        stats.finish(context)
+    return cost, path, context.expanded
+
+
+def _astar_time(graph: Graph, origins: List[Tuple[int, int]], goal: int, context: QueryContext,
+                heurestic_fn) -> QueryContext:
+    arrival = graph.timetable.arrival
+    stops = graph.timetable.stops
+    time_zero = context.time_zero
+    g_costs = context.costs
+    edge_to_node = context.edge_to_node
+    stamps = context.stamps
+    generation = context.generation
+    if isinstance(heurestic_fn, Landmarks):
+        # Landmark bounds are already in seconds and never overestimate
+        estimate = lambda stop: heurestic_fn.lower_bound(stop, goal)
+    else:
+        magic_number = 100000
+        estimate = lambda stop: magic_number * heurestic_fn(stops[stop], stops[goal])
+
+    heap = context.heap
+    # Priority: (f cost, curr_cost (time)), item: curr_node
+    for origin, offset in origins:
+        if not context.reached(origin) or offset < g_costs[origin]:
+            context.set(origin, offset, -1)
+            heap.push(origin, (offset + estimate(origin), offset))
+    while heap:
+        (_, curr_time), curr_node = heap.pop()
+        if curr_node == goal:
+            return context
+
+        context.expanded += 1
+        # List[List[Tuple[int, int, array, array, bool]]]
+        # start_node : [(end_node, line, connections, departures, overtaking)]
+        for neighbour, line, connections, departures, overtaking in graph.adjacency[curr_node]:
+            idx = first_departure(departures, time_zero, curr_time)
+            if idx < 0:
+                continue
+            # The first connection caught arrives first too unless connections of the group overtake each other
+            if overtaking:
+                idx = earliest_arrival(connections, departures, arrival, time_zero, curr_time, idx)
+            connection = connections[idx]
+            time_since_zero = (departures[idx] - time_zero) % SECONDS_IN_DAY
+            new_cost = time_since_zero + (arrival[connection] - departures[idx]) % SECONDS_IN_DAY
+            if stamps[neighbour] != generation or new_cost < g_costs[neighbour]:
+                stamps[neighbour] = generation
+                g_costs[neighbour] = new_cost
+                edge_to_node[neighbour] = connection
+                heap.push(neighbour, (new_cost + estimate(neighbour), new_cost))
+    return context
+
+
+def _bucket_lines(graph: Graph, start: int, goal: int, context: QueryContext, ignore_times: bool) -> Tuple[float, List[Edge]]:
+    """Dial's algorithm over (stop, line) states. Staying on a line costs nothing and boarding another one costs
+    ``line_change_cost``, so the bucket of a state is the number of lines used. Within a bucket states are taken
+    in order of arrival, each riding the first connection it can catch, which also makes the first route found
+    the earliest arrival among those with as few lines. With ``ignore_times`` departure times are not looked at
+    and states are taken in insertion order.
+    Boarding costs the same whatever line the stop was reached with, so every stop is boarded from only once,
+    from the first of its states taken out of the buckets, and later states only ride on where that boarding
+    does not already do better.
+    Returns the cost, ``line_change_cost`` per line used, and the path."""
+    timetable = graph.timetable
+    arrival = timetable.arrival
+    adjacency = graph.adjacency
+    adjacency_by_line = graph.adjacency_by_line
+    time_zero = context.time_zero
+    n_states = len(timetable.line_names) + 1
+    # state : (lines used, arrival, previous state, connection), the line of a state is stored shifted by one
+    labels: Dict[int, Tuple[int, float, int, int]] = {start * n_states: (0, 0, -1, -1)}
+    buckets: List[list] = [[(0, start * n_states)]]
+    boarded: Dict[int, Tuple[int, float]] = {}  # stop : (lines used, arrival) of the state it was boarded from
+
+    lines_used = 0
+    while lines_used < len(buckets):
+        bucket = buckets[lines_used]
+        position = 0
+        while position < len(bucket) if ignore_times else bucket:
+            if ignore_times:
+                curr_time, state = bucket[position]
+                position += 1
+            else:
+                curr_time, state = heapq.heappop(bucket)
+            label = labels[state]
+            if label[0] != lines_used or label[1] != curr_time:
+                continue
+            curr_node, curr_line = divmod(state, n_states)
+            if curr_node == goal:
+                return float(lines_used * line_change_cost), _lines_path(timetable, labels, state)
+            context.expanded += 1
+
+            if curr_node not in boarded:
+                boarded[curr_node] = (lines_used, curr_time)
+                groups = adjacency[curr_node]
+            elif boarded[curr_node][0] < lines_used and boarded[curr_node][1] <= curr_time:
+                # Boarding there with fewer lines already reached this line just as early
+                continue
+            else:
+                groups = adjacency_by_line[curr_node].get(curr_line - 1, ())
+            for neighbour, line, connections, departures, overtaking in groups:
+                connection = connections[0]
+                new_time = 0
+                if not ignore_times:
+                    idx = first_departure(departures, time_zero, curr_time)
+                    if idx < 0:
+                        continue
+                    if overtaking:
+                        idx = earliest_arrival(connections, departures, arrival, time_zero, curr_time, idx)
+                    connection = connections[idx]
+                    new_time = (departures[idx] - time_zero) % SECONDS_IN_DAY \
+                        + (arrival[connection] - departures[idx]) % SECONDS_IN_DAY
+                new_lines = lines_used if line + 1 == curr_line else lines_used + 1
+                new_state = neighbour * n_states + line + 1
+                old = labels.get(new_state)
+                if old is not None and (old[0], old[1]) <= (new_lines, new_time):
+                    continue
+                labels[new_state] = (new_lines, new_time, state, connection)
+                if new_lines == len(buckets):
+                    buckets.append([])
+                if ignore_times:
+                    buckets[new_lines].append((new_time, new_state))
+                else:
+                    heapq.heappush(buckets[new_lines], (new_time, new_state))
+        buckets[lines_used] = []
+        lines_used += 1
+    return float('inf'), []
+
+
+def _lines_path(timetable: Timetable, labels: Dict[int, Tuple[int, float, int, int]], state: int) -> List[Edge]:
     path: List[Edge] = []
-    curr_node: str = goal
-    while curr_node != start:
-        path.append(edge_to_node[curr_node])
-        curr_node = edge_to_node[curr_node].start
+    while labels[state][3] >= 0:
+        path.append(timetable.edge(labels[state][3]))
+        state = labels[state][2]
     path.reverse()
-    return costs[goal], path
-
-
-def _astar_time(graph: Graph, start: str, goal: str, time_zero: time, heurestic_fn) -> Optional[Tuple[Dict[str, float], Dict[str, Edge]]]:
-    f_costs = {node: float('inf') for nodes in graph.lines.values() for node in nodes}  # Pythonic code
-    g_costs = {node: float('inf') for nodes in graph.lines.values() for node in nodes}  # Pythonic code
-    edge_to_node = {node: None for nodes in graph.lines.values() for node in nodes}  # Pythonic code
-
-    f_costs[start] = 0
-    g_costs[start] = 0
-    # Priority, curr_cost (time), curr_node
-    pq = [(0, 0, start)]
-    while pq:
-        _, curr_time, curr_node = heapq.heappop(pq)
-        if curr_node == goal:
-            return g_costs, edge_to_node
-
-        if curr_time > g_costs[curr_node]:
-            continue
-        best_new_nodes: Dict[str, (float, float)] = {}
-        # Dict[str, Dict[str, Dict[str, List[Edge]]]] = {}  # line : Dict[start_node: [end_node, edges]]
-        for line, nodes in graph.lines.items():
-            if curr_node in nodes:
-                for neighbour, edges in nodes[curr_node].items():
-                    for edge in edges:
-                        time_since_zero = edge.time_since_time_zero(time_zero)
-                        if time_since_zero < curr_time:
-                            continue
-                        waiting_time = time_since_zero - curr_time
-                        new_cost = curr_time + waiting_time + edge.cost
-                        if new_cost < g_costs[edge.stop]:
-                            g_costs[edge.stop] = new_cost
-                            magic_number = 100000
-                            f_costs[edge.stop] = new_cost + magic_number * heurestic_fn(graph.nodes[edge.stop], graph.nodes[goal])
-                            edge_to_node[edge.stop] = edge
-                            heapq.heappush(pq, (f_costs[edge.stop], new_cost, edge.stop))
-                            best_new_nodes[edge.stop] = (f_costs[edge.stop], new_cost)
-        for node, prio_cost in best_new_nodes.items():
-            heapq.heappush(pq, (*prio_cost, node))
-    return None
-
-
-def _astar_lines(graph: Graph, start: str, goal: str, time_zero: time, heurestic_fn) -> Tuple[Dict[str, float], Dict[str, Edge]]:
-    f_costs = {node: float('inf') for nodes in graph.lines.values() for node in nodes}  # Pythonic code
-    g_costs = {node: float('inf') for nodes in graph.lines.values() for node in nodes}  # Pythonic code
-    edge_to_node = {node: None for nodes in graph.lines.values() for node in nodes}  # Pythonic code
-
-    f_costs[start] = 0
-    g_costs[start] = 0
-
-    # priority, curr_line, node
-    pq = [(0, '', start)]
-    while pq:
-        curr_cost_lines, curr_line, curr_node = heapq.heappop(pq)
-
-        if curr_node == goal:
-            return f_costs, edge_to_node
-
-        best_new_nodes: Dict[str, (float, float)] = {}
-        # Dict[str, Dict[str, Dict[str, List[Edge]]]] = {}  # line : Dict[start_node: [end_node, edges]]
-        for line, nodes in graph.lines.items():
-            if curr_node in nodes:
-                for neighbour, edges in nodes[curr_node].items():
-                    for edge in edges:
-                        g = g_costs[curr_node]
-                        if curr_line != edge.line:
-                            g += 10
-
-                        if g < g_costs[edge.stop]:
-                            g_costs[edge.stop] = g
-                            f_costs[edge.stop] = g + heurestic_fn(graph.nodes[edge.stop], graph.nodes[goal])
-                            edge_to_node[edge.stop] = edge
-
-                            best_new_nodes[edge.stop] = (f_costs[edge.stop], edge.line)
-        for node, prio_cost in best_new_nodes.items():
-            heapq.heappush(pq, (*prio_cost, node))
-    return f_costs, edge_to_node
+    return path
@@ -0,0 +1,67 @@
+import os
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import time
+from functools import partial
+from typing import Callable, List, Optional, Tuple
+from multiprocessing import shared_memory
+from dijkstra import dijkstra
+from Utils import Graph, Edge
+
+# The graph of the pool a worker thread belongs to, threads of different pools in one process keep their own
+_worker = threading.local()
+
+
+def route_batch(graph: Graph, queries: List[Tuple[str, str, time]], solver: Callable = dijkstra,
+                workers: Optional[int] = None, processes: bool = False) -> List[Tuple[float, List[Edge]]]:
+    """Answers many (start, goal, time_zero) queries over one graph, results come back in the order of ``queries``.
+    Threads share the graph, worker processes read it from shared memory, see ``create_pool``. A* is run by passing
+    e.g. ``partial(astar, criteria=Criteria.t, heurestics=manhattan_distance)`` as the solver."""
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(queries) // (4 * workers)) if processes else 1
+    with create_pool(graph, workers, processes) as pool:
+        return list(pool.map(partial(route_on_worker, solver), queries, chunksize=chunksize))
+
+
+def create_pool(graph: Graph, workers: Optional[int] = None, processes: bool = False) -> Executor:
+    """Pool whose workers answer ``route_on_worker`` calls on ``graph``. Every thread is bound to the graph of its
+    own pool, so pools over different graphs can run side by side. Worker processes all read one read-only copy
+    of the columns and the adjacency index in shared memory, released when the pool shuts down. Only what they
+    build lazily, e.g. the scan order for CSA, is their own."""
+    if processes:
+        return _SharedGraphPool(graph, workers)
+    return ThreadPoolExecutor(workers, initializer=_init_worker, initargs=(graph,))
+
+
+def route_on_worker(solver: Callable, query: Tuple[str, str, time]) -> Tuple[float, List[Edge]]:
+    return solver(_worker.graph, *query)
+
+
+def _init_worker(graph: Graph) -> None:
+    _worker.graph = graph
+
+
+class _SharedGraphPool(ProcessPoolExecutor):
+    def __init__(self, graph: Graph, workers: Optional[int]):
+        self._memory, layout = graph.share()
+        try:
+            super().__init__(workers, initializer=_attach_worker, initargs=(self._memory.name, layout))
+        except BaseException:
+            self._release()
+            raise
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        super().shutdown(wait, cancel_futures=cancel_futures)
+        self._release()
+
+    def _release(self) -> None:
+        if self._memory is not None:
+            self._memory.close()
+            self._memory.unlink()
+            self._memory = None
+
+
+def _attach_worker(memory_name: str, layout: dict) -> None:
+    # The block has to stay open while the worker reads the graph from it
+    _worker.memory = shared_memory.SharedMemory(name=memory_name)
+    _worker.graph = Graph.attach(_worker.memory, layout)
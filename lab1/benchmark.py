@@ -0,0 +1,187 @@
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import timeit
+from datetime import datetime, time
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
+from astar import astar_expanded, manhattan_distance, euclidean_distance, towncenter_distance, \
+    unidimensional_distance, cosine_distance, chebyshev_distance
+from csa import csa
+from astar import _astar_time
+from dijkstra import dijkstra, _dijkstra_time
+from Utils import Graph, Criteria, QueryContext, reconstruct_path, time_to_sec, _workspace
+
+HEURISTICS = {'manhattan': manhattan_distance, 'euclidean': euclidean_distance, 'towncenter': towncenter_distance,
+              'unidimensional': unidimensional_distance, 'cosine': cosine_distance, 'chebyshev': chebyshev_distance}
+HEAP_COUNTERS = ('pushes', 'pops', 'decrease_keys', 'stale')
+# Solvers whose queries use the LazyHeap of the workspace instead of the IndexedHeap
+LAZY_HEAP_SOLVERS = ('dijkstra[lazy_heap]', 'astar[t,landmarks,lazy_heap]')
+
+
+def make_workload(graph: Graph, n_queries: int, seed: int = 0) -> List[Tuple[str, str, time]]:
+    """Random (start, goal, time_zero) queries over ``Graph.nodes``, the same for the same seed and timetable."""
+    rnd = random.Random(seed)
+    names = sorted(graph.nodes)
+    return [(*rnd.sample(names, 2), time(rnd.randrange(24), rnd.randrange(60), rnd.randrange(60)))
+            for _ in range(n_queries)]
+
+
+def solvers(graph: Graph) -> Dict[str, Tuple[Criteria, Callable]]:
+    """name : (criteria, solver returning (cost, path, stops expanded or None)). The lines criteria is run once
+    only, its bucket search ignores the heuristic. The lazy_heap solvers run Dijkstra and landmark A* over the
+    heapq based LazyHeap, to compare heap operations against decrease-key."""
+    landmarks = graph.landmarks if graph.landmarks is not None else graph.preprocess_landmarks()
+    configurations = {'dijkstra': (Criteria.t, _dijkstra_expanded), 'csa': (Criteria.t, _csa_expanded),
+                      'dijkstra[lazy_heap]': (Criteria.t, _dijkstra_lazy_heap)}
+    for name, heuristic in {**HEURISTICS, 'landmarks': landmarks}.items():
+        configurations[f'astar[t,{name}]'] = (Criteria.t, partial(astar_expanded, criteria=Criteria.t,
+                                                                 heurestics=heuristic))
+    configurations['astar[t,landmarks,lazy_heap]'] = (Criteria.t, partial(_astar_lazy_heap, heurestics=landmarks))
+    configurations['astar[p]'] = (Criteria.p, partial(astar_expanded, criteria=Criteria.p,
+                                                      heurestics=manhattan_distance))
+    configurations['astar[p,ignore_times]'] = (Criteria.p, partial(astar_expanded, criteria=Criteria.p,
+                                                                   heurestics=manhattan_distance, ignore_times=True))
+    return configurations
+
+
+def run_benchmark(graph: Graph, queries: List[Tuple[str, str, time]],
+                  names: Optional[List[str]] = None) -> Dict[str, dict]:
+    """Runs every query through every solver (those in ``names`` only, if given). Per solver: latency percentiles
+    in milliseconds, totals of expanded stops and heap operations, and how many costs differ from the reference
+    of its criteria, dijkstra for travel time and the bucket search over departure times for lines."""
+    configurations = solvers(graph)
+    if names is not None:
+        configurations = {name: configurations[name] for name in names}
+    graph.scan_order
+    graph.adjacency_by_line
+    references = {Criteria.t: 'dijkstra', Criteria.p: 'astar[p]'}
+    costs: Dict[str, List[float]] = {}
+    results: Dict[str, dict] = {}
+    for name, (criteria, solver) in configurations.items():
+        latencies = []
+        expanded = 0
+        heap = dict.fromkeys(HEAP_COUNTERS, 0)
+        costs[name] = []
+        for query in queries:
+            begin_time = timeit.default_timer()
+            cost, path, query_expanded = solver(graph, *query)
+            end_time = timeit.default_timer()
+            latencies.append((end_time - begin_time) * 1000)
+            costs[name].append(cost)
+            # The heap of the thread's workspace is cleared when a query starts, so it holds this query's counts
+            workspace = _workspace(graph)
+            workspace_heap = workspace.lazy_heap if name in LAZY_HEAP_SOLVERS else workspace.heap
+            for counter in HEAP_COUNTERS:
+                heap[counter] += getattr(workspace_heap, counter)
+            expanded = None if query_expanded is None else expanded + query_expanded
+        results[name] = {'criteria': criteria.name, 'queries': len(queries), **_percentiles(latencies),
+                         'mean_ms': statistics.fmean(latencies) if latencies else 0.0,
+                         'expanded': expanded, 'heap': heap, 'reference': references[criteria]}
+
+    for name, result in results.items():
+        reference = costs.get(result['reference'])
+        if reference is None:
+            result['mismatches'] = None
+            continue
+        mismatches = [i for i, (cost, best) in enumerate(zip(costs[name], reference)) if cost != best]
+        result['mismatches'] = len(mismatches)
+        result['first_mismatches'] = mismatches[:5]
+    return results
+
+
+def compare_runs(baseline: dict, current: dict, tolerance: float = 0.1) -> List[str]:
+    """Regressions of ``current`` against ``baseline``, both as written by ``main``: a p50 or p95 latency more than
+    ``tolerance`` slower, more expanded stops, or more cost mismatches."""
+    regressions = []
+    for name, result in current['solvers'].items():
+        before = baseline['solvers'].get(name)
+        if before is None:
+            continue
+        for key in ('p50_ms', 'p95_ms'):
+            if result[key] > before[key] * (1 + tolerance):
+                regressions.append(f'{name}: {key} {before[key]:.3f} -> {result[key]:.3f}')
+        if result['expanded'] is not None and before['expanded'] is not None and result['expanded'] > before['expanded']:
+            regressions.append(f'{name}: expanded {before["expanded"]} -> {result["expanded"]}')
+        if (result['mismatches'] or 0) > (before['mismatches'] or 0):
+            regressions.append(f'{name}: mismatches {before["mismatches"]} -> {result["mismatches"]}')
+    return regressions
+
+
+def _dijkstra_expanded(graph: Graph, start: str, goal: str, time_zero: time) -> tuple:
+    cost, path = dijkstra(graph, start, goal, time_zero)
+    # Dijkstra expands every stop it pops
+    return cost, path, _workspace(graph).heap.pops
+
+
+def _csa_expanded(graph: Graph, start: str, goal: str, time_zero: time) -> tuple:
+    return (*csa(graph, start, goal, time_zero), None)
+
+
+def _dijkstra_lazy_heap(graph: Graph, start: str, goal: str, time_zero: time) -> tuple:
+    timetable = graph.timetable
+    start_id, goal_id = timetable.stop_ids[start], timetable.stop_ids[goal]
+    context = _dijkstra_time(graph, [(start_id, 0)], QueryContext(graph, time_to_sec(time_zero), lazy_heap=True))
+    return context.cost(goal_id), reconstruct_path(timetable, context, start_id, goal_id), context.expanded
+
+
+def _astar_lazy_heap(graph: Graph, start: str, goal: str, time_zero: time, heurestics: Callable) -> tuple:
+    timetable = graph.timetable
+    start_id, goal_id = timetable.stop_ids[start], timetable.stop_ids[goal]
+    context = _astar_time(graph, [(start_id, 0)], goal_id, QueryContext(graph, time_to_sec(time_zero), lazy_heap=True),
+                          heurestics)
+    return context.cost(goal_id), reconstruct_path(timetable, context, start_id, goal_id), context.expanded
+
+
+def _percentiles(latencies: List[float]) -> Dict[str, float]:
+    if len(latencies) < 2:
+        value = latencies[0] if latencies else 0.0
+        return {'p50_ms': value, 'p95_ms': value, 'p99_ms': value, 'max_ms': value}
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+    return {'p50_ms': cuts[49], 'p95_ms': cuts[94], 'p99_ms': cuts[98], 'max_ms': max(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Latency benchmark of the lab1 solvers on a seeded random workload')
+    parser.add_argument('--csv', default='connection_graph.csv')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--solvers', nargs='*', default=None, help='run only these, e.g. dijkstra "astar[t,landmarks]"')
+    parser.add_argument('--output', default=None, help='write the results as JSON to this file')
+    parser.add_argument('--baseline', default=None, help='JSON of an earlier run to report regressions against')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    args = parser.parse_args()
+
+    graph = Graph.from_csv(args.csv)
+    queries = make_workload(graph, args.queries, args.seed)
+    begin_time = timeit.default_timer()
+    graph.preprocess_landmarks()
+    landmarks_ms = (timeit.default_timer() - begin_time) * 1000
+    results = run_benchmark(graph, queries, args.solvers)
+    report = {'meta': {'csv': args.csv, 'queries': args.queries, 'seed': args.seed, 'stops': len(graph.nodes),
+                       'connections': len(graph.timetable), 'landmarks_ms': landmarks_ms,
+                       'python': platform.python_version(), 'created': datetime.now().isoformat(timespec='seconds')},
+              'solvers': results}
+
+    print(f'landmarks: preprocessing "{landmarks_ms:.3f}" ms', file=sys.stderr)
+    for name, result in results.items():
+        print(f'{name}: p50 "{result["p50_ms"]:.3f}" ms, p95 "{result["p95_ms"]:.3f}" ms, '
+              f'p99 "{result["p99_ms"]:.3f}" ms, expanded "{result["expanded"]}", heap pops "{result["heap"]["pops"]}", '
+              f'mismatches against {result["reference"]} "{result["mismatches"]}"', file=sys.stderr)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            regressions = compare_runs(json.load(f), report, args.tolerance)
+        for regression in regressions:
+            print(f'Regression: {regression}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+from bisect import bisect_left
+from datetime import time
+from Utils import Graph, Edge, SECONDS_IN_DAY, time_to_sec, reconstruct_path, QueryContext
+from typing import List, Tuple
+
+
+def csa(graph: Graph, start: str, goal: str, time_zero: time) -> Tuple[float, List[Edge]]:
+    """Earliest arrival by Connection Scan, same results as ``dijkstra`` for the time criteria."""
+    timetable = graph.timetable
+    start_id = timetable.stop_ids[start]
+    goal_id = timetable.stop_ids[goal]
+    context = _csa_time(graph, start_id, goal_id, QueryContext(graph, time_to_sec(time_zero)))
+    return context.cost(goal_id), reconstruct_path(timetable, context, start_id, goal_id)
+
+
+def _csa_time(graph: Graph, start: int, goal: int, context: QueryContext) -> QueryContext:
+    timetable = graph.timetable
+    start_stop, end_stop, arrival = timetable.start, timetable.end, timetable.arrival
+    connections, departures = graph.scan_order
+    time_zero = context.time_zero
+    costs = context.costs
+    edge_to_node = context.edge_to_node
+    stamps = context.stamps
+    generation = context.generation
+    context.set(start, 0, -1)
+    goal_cost = context.cost(goal)
+
+    # Departures before time_zero are scanned last, as they happen on the next day
+    first = bisect_left(departures, time_zero)
+    for begin, end, offset in ((first, len(connections), -time_zero),
+                               (0, first, SECONDS_IN_DAY - time_zero)):
+        for idx in range(begin, end):
+            time_since_zero = departures[idx] + offset
+            if time_since_zero >= goal_cost:
+                return context
+            connection = connections[idx]
+            stop = start_stop[connection]
+            if stamps[stop] != generation or costs[stop] > time_since_zero:
+                continue
+            new_cost = time_since_zero + (arrival[connection] - departures[idx]) % SECONDS_IN_DAY
+            next_stop = end_stop[connection]
+            if stamps[next_stop] != generation or new_cost < costs[next_stop]:
+                stamps[next_stop] = generation
+                costs[next_stop] = new_cost
+                edge_to_node[next_stop] = connection
+                if next_stop == goal:
+                    goal_cost = new_cost
+    return context
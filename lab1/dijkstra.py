@@ -1,54 +1,70 @@
-import heapq
 from datetime import datetime, time
-from Utils import Graph, Edge, Criteria
-from typing import List, Tuple, Dict
-
-
-def dijkstra(graph: Graph, start: str, goal: str, time_zero: time) -> Tuple[float, List[Edge]]:
-    return _dijkstra_shortest_path(graph, start, goal, time_zero)
-
-
-def _dijkstra_shortest_path(graph: Graph, start: str, goal: str, time_zero: time) -> Tuple[float, List[Edge]]:
-    costs, edge_to_node = _dijkstra_time(graph, start, time_zero)
-    path: List[Edge] = []
-    curr_node: str = goal
-    while curr_node != start:
-        path.append(edge_to_node[curr_node])
-        curr_node = edge_to_node[curr_node].start
-    path.reverse()
-    return costs[goal], path
-
-
-def _dijkstra_time(graph: Graph, start: str, time_zero: time) -> Tuple[Dict[str, float], Dict[str, Edge]]:
-    # Dict[str, Dict[str, Dict[str, List[Edge]]]] = {}  # line : Dict[start_node: [end_node, edges]]
-    costs = {node: float('inf') for nodes in graph.lines.values() for node in nodes}  # Pythonic code
-    edge_to_node = {node: None for nodes in graph.lines.values() for node in nodes}  # Pythonic code
-    visited = set()
-
-    pq = [(0, start)]
-    while pq:
-        curr_cost, curr_node = heapq.heappop(pq)
-        if curr_node in visited:
-            continue
-        else:
-            visited.add(curr_node)
-
-        if curr_cost > costs[curr_node]:
-            continue
-        best_new_nodes = {}
-        for line, nodes in graph.lines.items():
-            if curr_node in nodes:
-                for neighbour, edges in nodes[curr_node].items():
-                    for edge in edges:
-                        time_since_zero = edge.time_since_time_zero(time_zero)
-                        if time_since_zero < curr_cost:
-                            continue
-                        waiting_time = time_since_zero - curr_cost
-                        new_cost = curr_cost + edge.cost + waiting_time
-                        if new_cost < costs[edge.stop]:
-                            costs[edge.stop] = new_cost
-                            edge_to_node[edge.stop] = edge
-                            best_new_nodes[edge.stop] = new_cost
-        for node, cost in best_new_nodes.items():
-            heapq.heappush(pq, (cost, node))
-    return costs, edge_to_node
+from Utils import Graph, Edge, Criteria, SECONDS_IN_DAY, time_to_sec, first_departure, earliest_arrival, \
+    reconstruct_path, origin_path, QueryContext, SearchStats, phase
+from typing import List, Tuple, Dict, Optional
+
+
+def dijkstra(graph: Graph, start: str, goal: str, time_zero: time,
+             stats: Optional[SearchStats] = None) -> Tuple[float, List[Edge]]:
+    return _dijkstra_shortest_path(graph, start, goal, time_zero, stats)
+
+
+def dijkstra_from(graph: Graph, origins: List[Tuple[str, int]], goal: str, time_zero: time) -> Tuple[float, Optional[str], List[Edge]]:
+    """Earliest arrival from whichever of ``origins`` is best, each given as (stop, seconds needed to get there after
+    ``time_zero``). Returns the cost including that offset, the origin the route starts from and the path."""
+    timetable = graph.timetable
+    goal_id = timetable.stop_ids[goal]
+    seeds = [(timetable.stop_ids[stop], offset) for stop, offset in origins]
+    context = _dijkstra_time(graph, seeds, QueryContext(graph, time_to_sec(time_zero)))
+    origin, path = origin_path(timetable, context, goal_id)
+    return context.cost(goal_id), timetable.stops[origin].name if origin >= 0 else None, path
+
+
+def _dijkstra_shortest_path(graph: Graph, start: str, goal: str, time_zero: time,
+                            stats: Optional[SearchStats] = None) -> Tuple[float, List[Edge]]:
+    timetable = graph.timetable
+    start_id = timetable.stop_ids[start]
+    goal_id = timetable.stop_ids[goal]
+    with phase(stats, 'search'):
+        context = _dijkstra_time(graph, [(start_id, 0)], QueryContext(graph, time_to_sec(time_zero), stats=stats))
+    with phase(stats, 'path'):
+        path = reconstruct_path(timetable, context, start_id, goal_id)
+    if stats is not None:
+        stats.finish(context)
+    return context.cost(goal_id), path
+
+
+def _dijkstra_time(graph: Graph, origins: List[Tuple[int, int]], context: QueryContext) -> QueryContext:
+    # List[List[Tuple[int, int, array, array, bool]]]
+    # start_node : [(end_node, line, connections, departures, overtaking)]
+    arrival = graph.timetable.arrival
+    time_zero = context.time_zero
+    costs = context.costs
+    edge_to_node = context.edge_to_node
+    stamps = context.stamps
+    generation = context.generation
+    heap = context.heap
+
+    for origin, offset in origins:
+        if not context.reached(origin) or offset < costs[origin]:
+            context.set(origin, offset, -1)
+            heap.push(origin, offset)
+    while heap:
+        curr_cost, curr_node = heap.pop()
+        context.expanded += 1
+        for neighbour, line, connections, departures, overtaking in graph.adjacency[curr_node]:
+            idx = first_departure(departures, time_zero, curr_cost)
+            if idx < 0:
+                continue
+            # The first connection caught arrives first too unless connections of the group overtake each other
+            if overtaking:
+                idx = earliest_arrival(connections, departures, arrival, time_zero, curr_cost, idx)
+            connection = connections[idx]
+            time_since_zero = (departures[idx] - time_zero) % SECONDS_IN_DAY
+            new_cost = time_since_zero + (arrival[connection] - departures[idx]) % SECONDS_IN_DAY
+            if stamps[neighbour] != generation or new_cost < costs[neighbour]:
+                stamps[neighbour] = generation
+                costs[neighbour] = new_cost
+                edge_to_node[neighbour] = connection
+                heap.push(neighbour, new_cost)
+    return context
@@ -1,10 +1,14 @@
+import argparse
 import timeit
 import sys
-from typing import Callable
+from typing import Callable, Optional
 from datetime import time
 from dijkstra import dijkstra
+from csa import csa
+from profile_search import profile
+from raptor import raptor
 from astar import astar, manhattan_distance, euclidean_distance, chebyshev_distance
-from Utils import Graph, print_result, Criteria, load_csv
+from Utils import Graph, print_result, Criteria, SearchStats
 
 '''Deadline na środę 22.03 godzina 7:30
 
@@ -26,38 +30,84 @@ Review po 23.03 do sprawek:
 '''
 
 
-def task1(start: str, end: str, start_time: time) -> None:
-    data = load_csv()
-    graph = Graph(data)
+def task1(start: str, end: str, start_time: time, solver: Callable = dijkstra, stats: Optional[SearchStats] = None) -> None:
+    graph = Graph.from_csv()
+    graph.scan_order  # built lazily by the first connection scan, keep it out of the timing
     begin_time = timeit.default_timer()
-    cost, path = dijkstra(graph, start, end, start_time)
+    cost, path = solver(graph, start, end, start_time) if stats is None else solver(graph, start, end, start_time, stats=stats)
     end_time = timeit.default_timer()
 
     print_result(path, start_time)
-    print(f'Dijkstra: Cost function "{cost}", execution time "{end_time - begin_time}" seconds', file=sys.stderr)
+    print(f'{solver.__name__}: Cost function "{cost}", execution time "{end_time - begin_time}" seconds', file=sys.stderr)
+    print_stats(stats)
 
 
-def task2(start: str, end: str, time_zero: time, criteria: Criteria, heuestics: Callable):
-    data = load_csv()
-    graph = Graph(data)
+def task3(start: str, end: str, window_start: time, window_end: time) -> None:
+    graph = Graph.from_csv()
+    graph.scan_order
     begin_time = timeit.default_timer()
-    cost, path = astar(graph, start, end, time_zero, criteria, heuestics)
+    journeys = profile(graph, start, end, window_start, window_end)
+    end_time = timeit.default_timer()
+
+    for departure, arrival, path in journeys:
+        print(f'Departure "{departure}", arrival "{arrival}" across {len({edge.line for edge in path})} lines')
+    print(f'Profile: {len(journeys)} optimal journeys, execution time "{end_time - begin_time}" seconds', file=sys.stderr)
+
+
+def task4(start: str, end: str, time_zero: time, max_transfers: int = None) -> None:
+    graph = Graph.from_csv()
+    begin_time = timeit.default_timer()
+    front = raptor(graph, start, end, time_zero, max_transfers)
+    end_time = timeit.default_timer()
+
+    for line_changes, cost, path in front:
+        print_result(path, time_zero)
+    print(f'Raptor: {len(front)} Pareto optimal journeys, execution time "{end_time - begin_time}" seconds', file=sys.stderr)
+
+
+def task2(start: str, end: str, time_zero: time, criteria: Criteria, heuestics: Callable, stats: Optional[SearchStats] = None):
+    graph = Graph.from_csv()
+    begin_time = timeit.default_timer()
+    cost, path = astar(graph, start, end, time_zero, criteria, heuestics, stats=stats)
     end_time = timeit.default_timer()
 
     print_result(path, time_zero)
     print(f'A* with criteria "{criteria.name}": Cost function "{cost}", execution time "{end_time - begin_time}" seconds', file=sys.stderr)
+    print_stats(stats)
+
+
+def make_stats(enabled: bool, sample_every: int = 0) -> Optional[SearchStats]:
+    """Fresh SearchStats for one task, None when disabled. With ``sample_every`` every n-th expansion is printed."""
+    if not enabled:
+        return None
+    if sample_every <= 0:
+        return SearchStats()
+    return SearchStats(lambda stop, cost: print(f'  expanded stop "{stop}" at cost "{cost}"', file=sys.stderr), sample_every)
+
+
+def print_stats(stats: Optional[SearchStats]) -> None:
+    if stats is not None:
+        print('Search stats: ' + ', '.join(f'{name} "{value}"' for name, value in stats.as_dict().items()), file=sys.stderr)
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Lab 1 routing tasks')
+    parser.add_argument('--stats', action='store_true', help='print search counters and phase times of dijkstra and A*')
+    parser.add_argument('--sample-every', type=int, default=0, help='with --stats also print every n-th expanded stop')
+    args = parser.parse_args()
+
     start_time = time(19, 58, 0)
     begin = "Hynka"
     end = 'Malinowskiego'
 
-    task1(begin, end, start_time)
-    task2(begin, end, start_time, Criteria.t, manhattan_distance)
-    task2(begin, end, start_time, Criteria.t, euclidean_distance)
-    task2(begin, end, start_time, Criteria.t, chebyshev_distance)
-    task2(begin, end, start_time, Criteria.p, manhattan_distance)
+    task1(begin, end, start_time, stats=make_stats(args.stats, args.sample_every))
+    task1(begin, end, start_time, csa)
+    task2(begin, end, start_time, Criteria.t, manhattan_distance, make_stats(args.stats, args.sample_every))
+    task2(begin, end, start_time, Criteria.t, euclidean_distance, make_stats(args.stats, args.sample_every))
+    task2(begin, end, start_time, Criteria.t, chebyshev_distance, make_stats(args.stats, args.sample_every))
+    task2(begin, end, start_time, Criteria.p, manhattan_distance, make_stats(args.stats, args.sample_every))
+    task3(begin, end, time(7, 0, 0), time(9, 0, 0))
+    task4(begin, end, start_time)
 
 
 if __name__ == '__main__':
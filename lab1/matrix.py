@@ -0,0 +1,51 @@
+import os
+from array import array
+from concurrent.futures import as_completed
+from datetime import time
+from typing import Callable, List, Optional
+import numpy as np
+from batch import create_pool, route_on_worker
+from dijkstra import _dijkstra_time
+from Utils import Graph, QueryContext, time_to_sec
+
+
+def travel_time_matrix(graph: Graph, origins: List[str], destinations: Optional[List[str]] = None,
+                       time_zero: time = time(0), workers: Optional[int] = None, processes: bool = True,
+                       progress: Optional[Callable[[int, int], None]] = None, chunk_size: int = 8) -> np.ndarray:
+    """Travel times in seconds from every origin to every destination (all origins if None) leaving at
+    ``time_zero``, ``inf`` where a destination cannot be reached. Every origin takes one one-to-all search, the
+    origins are split into chunks of ``chunk_size`` that run in a pool whose worker processes share one read-only
+    copy of the graph in shared memory. ``progress(done, total)`` is called with the number of finished origins
+    whenever a chunk comes back."""
+    destinations = origins if destinations is None else destinations
+    stop_ids = graph.timetable.stop_ids
+    origin_ids = [stop_ids[stop] for stop in origins]
+    destination_ids = array('i', [stop_ids[stop] for stop in destinations])
+    matrix = np.full((len(origins), len(destinations)), np.inf)
+    if not origins or not destinations:
+        return matrix
+
+    workers = workers or os.cpu_count() or 1
+    chunks = [(row, origin_ids[row:row + chunk_size]) for row in range(0, len(origin_ids), chunk_size)]
+    done = 0
+    with create_pool(graph, workers, processes) as pool:
+        futures = [pool.submit(route_on_worker, _matrix_rows, (origin_chunk, destination_ids, time_to_sec(time_zero)))
+                   for _, origin_chunk in chunks]
+        rows_of = {future: row for future, (row, _) in zip(futures, chunks)}
+        for future in as_completed(futures):
+            row = rows_of[future]
+            rows = np.frombuffer(future.result(), dtype=np.float64).reshape(-1, len(destinations))
+            matrix[row:row + len(rows)] = rows
+            done += len(rows)
+            if progress is not None:
+                progress(done, len(origins))
+    return matrix
+
+
+def _matrix_rows(graph: Graph, origins: List[int], destinations: array, time_zero: int) -> bytes:
+    # The rows go back from the worker as one flat buffer instead of a pickled list of floats
+    rows = array('d')
+    for origin in origins:
+        context = _dijkstra_time(graph, [(origin, 0)], QueryContext(graph, time_zero))
+        rows.extend(context.cost(destination) for destination in destinations)
+    return rows.tobytes()
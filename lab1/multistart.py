@@ -0,0 +1,104 @@
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import TSTSP
+
+_worker_memory: Optional[shared_memory.SharedMemory] = None
+_worker_instance: Optional[TSTSP.Instance] = None
+
+
+def multi_start(cities: List[List[int]], n_starts: Optional[int] = None, workers: Optional[int] = None,
+                rounds: int = 1, iterations: Optional[int] = None, seed: int = 0,
+                settings: Optional[Dict[str, object]] = None) -> Tuple[List[int], float, List[dict]]:
+    """Independent tabu searches from ``n_starts`` random tours (one per worker by default) in a process pool.
+    With ``rounds`` > 1 they are synchronised after every round of ``iterations`` (max_iterations // rounds by
+    default): the better half goes on from its own best tour, the worse half from a double bridge kick of the best
+    tour found so far. ``settings`` override the TSTSP settings, e.g. {'neighbourhood': '2opt'}, in every worker.
+    The distance matrix is built once and read by all workers from shared memory, in the on_demand mode every
+    worker computes distances itself. With a constructive ``initial_tour`` setting the first start is that tour and
+    the others double bridge kicks of it. Returns the best tour, its cost and the stats of every start."""
+    settings = settings or {}
+    workers = workers or os.cpu_count() or 1
+    n_starts = n_starts or workers
+    n = len(cities)
+    rnd = random.Random(seed)
+    stats = [{'start': start, 'workers': set(), 'iterations': 0, 'improvements': 0, 'seconds': 0.0}
+             for start in range(n_starts)]
+    best_tour, best_cost = None, float('inf')
+
+    memory = None
+    shape = None
+    if n <= settings.get('max_matrix_cities', TSTSP.max_matrix_cities):
+        matrix = TSTSP.distance_matrix(np.array(cities, dtype=np.float64).reshape(n, -1),
+                                       settings.get('block_rows', TSTSP.block_rows))
+        memory = shared_memory.SharedMemory(create=True, size=max(1, matrix.nbytes))
+        shape = matrix.shape
+        np.ndarray(shape, dtype=np.float32, buffer=memory.buf)[:] = matrix
+        del matrix
+    try:
+        with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                 initargs=(cities, settings, memory and memory.name, shape)) as pool:
+            if settings.get('initial_tour', TSTSP.initial_tour) == 'random':
+                tours = [rnd.sample(range(n), n) for _ in range(n_starts)]
+            else:
+                # A worker has the candidate lists at hand already
+                first = pool.submit(_initial_on_worker).result()
+                tours = [first] + [double_bridge(first, rnd) for _ in range(n_starts - 1)]
+            for round_ in range(rounds):
+                futures = [pool.submit(_search_on_worker, tour, iterations, rounds) for tour in tours]
+                results = [future.result() for future in futures]
+                for start, (tour, cost, search_stats, pid) in enumerate(results):
+                    start_stats = stats[start]
+                    start_stats.setdefault('start_cost', search_stats['start_cost'])
+                    start_stats['workers'].add(pid)
+                    for key in ('iterations', 'improvements', 'seconds'):
+                        start_stats[key] += search_stats[key]
+                    if cost < start_stats.get('best_cost', float('inf')):
+                        start_stats['best_cost'] = cost
+                    if cost < best_cost:
+                        best_tour, best_cost = tour, cost
+                if round_ + 1 < rounds:
+                    order = sorted(range(n_starts), key=lambda start: results[start][1])
+                    tours = [results[start][0] for start in range(n_starts)]
+                    for start in order[(n_starts + 1) // 2:]:
+                        tours[start] = double_bridge(best_tour, rnd)
+    finally:
+        if memory is not None:
+            memory.close()
+            memory.unlink()
+    for start_stats in stats:
+        start_stats['workers'] = sorted(start_stats['workers'])
+    return best_tour, best_cost, stats
+
+
+def double_bridge(tour: List[int], rnd: random.Random) -> List[int]:
+    """Cuts the tour into four parts A B C D and joins them as A C B D, a kick 2-opt and Or-opt do not undo easily."""
+    if len(tour) < 8:
+        return rnd.sample(tour, len(tour))
+    i, j, k = sorted(rnd.sample(range(1, len(tour)), 3))
+    return tour[:i] + tour[j:k] + tour[i:j] + tour[k:]
+
+
+def _init_worker(cities: List[List[int]], settings: Dict[str, object], memory_name: Optional[str],
+                 shape: Optional[Tuple[int, int]]) -> None:
+    global _worker_memory, _worker_instance
+    matrix = None
+    if memory_name is not None:
+        # The segment has to stay open while the search reads the matrix
+        _worker_memory = shared_memory.SharedMemory(name=memory_name)
+        matrix = np.ndarray(shape, dtype=np.float32, buffer=_worker_memory.buf)
+    _worker_instance = TSTSP.Instance(cities, settings, matrix)
+
+
+def _initial_on_worker() -> List[int]:
+    return _worker_instance.initial_solution()
+
+
+def _search_on_worker(tour: List[int], iterations: Optional[int], rounds: int) -> Tuple[List[int], float, dict, int]:
+    if iterations is None:
+        iterations = max(1, _worker_instance.max_iterations // rounds)
+    best_tour, best_cost, stats = TSTSP.tabu_search(_worker_instance, tour, iterations, verbose=False)
+    return best_tour, best_cost, stats, os.getpid()
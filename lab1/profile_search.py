@@ -0,0 +1,108 @@
+from bisect import bisect_left, bisect_right
+from datetime import time
+from Utils import Graph, Edge, SECONDS_IN_DAY, time_to_sec, sec_to_time
+from typing import Dict, List, Optional, Tuple
+
+# (arrival, departure from start, connection, previous label), times in seconds since the window start
+Label = Tuple[int, int, int, Optional[tuple]]
+
+
+def profile(graph: Graph, start: str, goal: str, window_start: time, window_end: time) -> List[Tuple[time, time, List[Edge]]]:
+    """All Pareto optimal journeys between ``start`` and ``goal`` leaving in the window, as
+    (departure, arrival, path) sorted by departure. A single sweep replaces one ``dijkstra`` call per departure."""
+    timetable = graph.timetable
+    goal_id = timetable.stop_ids[goal]
+    labels = _profile_scan(graph, timetable.stop_ids[start], time_to_sec(window_start), time_to_sec(window_end),
+                           goal_id)
+    offset = time_to_sec(window_start)
+    return [(sec_to_time(offset + label[1]), sec_to_time(offset + label[0]), _journey(timetable, label))
+            for label in labels[goal_id]]
+
+
+def profile_all(graph: Graph, start: str, window_start: time, window_end: time) -> Dict[str, List[Tuple[time, time]]]:
+    """Pareto sets of (departure, arrival) from ``start`` to every reachable stop for departures in the window."""
+    timetable = graph.timetable
+    labels = _profile_scan(graph, timetable.stop_ids[start], time_to_sec(window_start), time_to_sec(window_end))
+    offset = time_to_sec(window_start)
+    return {timetable.stops[stop].name: [(sec_to_time(offset + label[1]), sec_to_time(offset + label[0]))
+                                         for label in stop_labels]
+            for stop, stop_labels in enumerate(labels) if stop_labels}
+
+
+def _profile_scan(graph: Graph, start: int, window_start: int, window_end: int,
+                  goal: Optional[int] = None) -> List[List[Label]]:
+    """Profile Connection Scan. Every stop keeps labels sorted by arrival, which on a Pareto front also sorts them
+    by departure from ``start``, so the label a connection can continue from is found by bisection.
+    With a ``goal`` labels already dominated at the goal are dropped and the scan ends once the goal is settled
+    for the latest departure of the window."""
+    timetable = graph.timetable
+    start_stop, end_stop, arrival = timetable.start, timetable.end, timetable.arrival
+    connections, departures = graph.scan_order
+    window_length = (window_end - window_start) % SECONDS_IN_DAY
+    n_stops = len(timetable.stops)
+    labels: List[List[Label]] = [[] for _ in range(n_stops)]
+    arrivals: List[List[int]] = [[] for _ in range(n_stops)]
+    leaves: List[List[int]] = [[] for _ in range(n_stops)]
+
+    goal_arrivals = arrivals[goal] if goal is not None else []
+    goal_leaves = leaves[goal] if goal is not None else []
+    last_leave = -1  # latest departure from start in the window seen so far
+
+    first = bisect_left(departures, window_start)
+    for begin, end, offset in ((first, len(connections), -window_start),
+                               (0, first, SECONDS_IN_DAY - window_start)):
+        for idx in range(begin, end):
+            departure = departures[idx] + offset
+            if goal_leaves and departure > window_length and goal_leaves[-1] >= last_leave \
+                    and departure >= goal_arrivals[-1]:
+                return labels
+            connection = connections[idx]
+            stop = start_stop[connection]
+            prev: Optional[Label] = None
+            leave = -1
+            if stop == start:
+                if departure > window_length:
+                    continue
+                leave = last_leave = departure
+            else:
+                reachable = bisect_right(arrivals[stop], departure) - 1
+                if reachable < 0:
+                    continue
+                prev = labels[stop][reachable]
+                leave = prev[1]
+            new_arrival = departure + (arrival[connection] - departures[idx]) % SECONDS_IN_DAY
+            next_stop = end_stop[connection]
+            if next_stop == start:
+                continue
+            if goal_arrivals:
+                dominating = bisect_right(goal_arrivals, new_arrival) - 1
+                if dominating >= 0 and goal_leaves[dominating] >= leave:
+                    continue
+            _insert(labels[next_stop], arrivals[next_stop], leaves[next_stop],
+                    (new_arrival, leave, connection, prev))
+    return labels
+
+
+def _insert(labels: List[Label], arrivals: List[int], leaves: List[int], label: Label) -> None:
+    new_arrival, leave = label[0], label[1]
+    idx = bisect_right(arrivals, new_arrival)
+    # The label arriving right before leaves the latest of all that arrive no later
+    if idx > 0 and leaves[idx - 1] >= leave:
+        return
+    # Labels arriving as early leave earlier than this one, they are dominated as well as the later ones left behind
+    first = bisect_left(arrivals, new_arrival, 0, idx)
+    last = idx
+    while last < len(labels) and leaves[last] <= leave:
+        last += 1
+    labels[first:last] = [label]
+    arrivals[first:last] = [new_arrival]
+    leaves[first:last] = [leave]
+
+
+def _journey(timetable, label: Label) -> List[Edge]:
+    path: List[Edge] = []
+    while label is not None:
+        path.append(timetable.edge(label[2]))
+        label = label[3]
+    path.reverse()
+    return path
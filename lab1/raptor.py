@@ -0,0 +1,117 @@
+import heapq
+from datetime import time
+from Utils import Graph, Edge, Timetable, SECONDS_IN_DAY, time_to_sec, first_departure, earliest_arrival
+from typing import Dict, List, Optional, Tuple
+
+
+def raptor(graph: Graph, start: str, goal: str, time_zero: time,
+           max_transfers: Optional[int] = None) -> List[Tuple[int, float, List[Edge]]]:
+    """Pareto front of (line changes, cost, path) between ``start`` and ``goal``, sorted by line changes.
+    The cost is in seconds since ``time_zero`` like for ``dijkstra``, the last entry is the fastest journey."""
+    timetable = graph.timetable
+    start_id = timetable.stop_ids[start]
+    goal_id = timetable.stop_ids[goal]
+    rounds = _raptor_rounds(graph, start_id, goal_id, time_to_sec(time_zero), max_transfers)
+
+    front = []
+    best = float('inf')
+    for ride_count in range(1, len(rounds)):
+        arrival = rounds[ride_count][0]
+        if arrival[goal_id] < best:
+            best = arrival[goal_id]
+            front.append((ride_count - 1, best, _journey(timetable, rounds, ride_count, start_id, goal_id)))
+    return front
+
+
+Round = Tuple[List[float], Dict[int, Tuple[int, int]], Dict[int, int]]
+
+
+def _raptor_rounds(graph: Graph, start: int, goal: int, time_zero: int, max_transfers: Optional[int]) -> List[Round]:
+    """Round k holds the earliest arrivals using at most k rides, a ride being a run of connections of one line.
+    A round boards every line at the stops the previous round improved and rides it on, in order of arrival.
+    Riding on from a stop is only needed while it beats the previous round there, otherwise the ride could have
+    been boarded at that stop one round earlier.
+    Each round keeps its arrivals, (connection, previous connection of the ride or -1) for the stops it improved
+    and the previous connection of every ride extension, so journeys can be rebuilt."""
+    timetable = graph.timetable
+    arrival = timetable.arrival
+    adjacency = graph.adjacency
+    n_stops = len(timetable.stops)
+    max_rounds = len(timetable.line_names) if max_transfers is None else max_transfers + 1
+
+    initial = [float('inf')] * n_stops
+    initial[start] = 0
+    rounds: List[Round] = [(initial, {start: (-1, -1)}, {})]
+    for _ in range(max_rounds):
+        previous, marked, _ = rounds[-1]
+        current = previous[:]
+        improved: Dict[int, Tuple[int, int]] = {}
+        rides: Dict[int, int] = {}
+        on_board: Dict[int, int] = {}  # line * n_stops + stop : arrival
+        pq = []
+        for stop in marked:
+            for neighbour, line, connections, departures, overtaking in adjacency[stop]:
+                idx = first_departure(departures, time_zero, previous[stop])
+                if idx < 0:
+                    continue
+                if overtaking:
+                    idx = earliest_arrival(connections, departures, arrival, time_zero, previous[stop], idx)
+                new_arrival = (departures[idx] - time_zero) % SECONDS_IN_DAY \
+                    + (arrival[connections[idx]] - departures[idx]) % SECONDS_IN_DAY
+                _ride(pq, on_board, rides, line * n_stops + neighbour, new_arrival, connections[idx], -1)
+
+        while pq:
+            curr_arrival, key, connection = heapq.heappop(pq)
+            if on_board[key] < curr_arrival:
+                continue
+            stop = key % n_stops
+            if curr_arrival >= current[goal]:
+                break
+            if curr_arrival < current[stop]:
+                current[stop] = curr_arrival
+                improved[stop] = (connection, rides[connection])
+            if curr_arrival >= previous[stop]:
+                continue
+            line = key // n_stops
+            for neighbour, neighbour_line, connections, departures, overtaking in adjacency[stop]:
+                if neighbour_line != line:
+                    continue
+                idx = first_departure(departures, time_zero, curr_arrival)
+                if idx < 0:
+                    continue
+                if overtaking:
+                    idx = earliest_arrival(connections, departures, arrival, time_zero, curr_arrival, idx)
+                new_arrival = (departures[idx] - time_zero) % SECONDS_IN_DAY \
+                    + (arrival[connections[idx]] - departures[idx]) % SECONDS_IN_DAY
+                _ride(pq, on_board, rides, line * n_stops + neighbour, new_arrival, connections[idx], connection)
+        if not improved:
+            break
+        rounds.append((current, improved, rides))
+    return rounds
+
+
+def _ride(pq: list, on_board: Dict[int, int], rides: Dict[int, int], key: int, new_arrival: int, connection: int,
+          prev_connection: int) -> None:
+    if new_arrival < on_board.get(key, float('inf')):
+        on_board[key] = new_arrival
+        rides[connection] = prev_connection
+        heapq.heappush(pq, (new_arrival, key, connection))
+
+
+def _journey(timetable: Timetable, rounds: List[Round], ride_count: int, start: int, goal: int) -> List[Edge]:
+    path: List[Edge] = []
+    stop = goal
+    while stop != start:
+        # The label of the stop comes from the latest round up to ride_count that improved it
+        while stop not in rounds[ride_count][1]:
+            ride_count -= 1
+        connection, prev_connection = rounds[ride_count][1][stop]
+        path.append(timetable.edge(connection))
+        while prev_connection >= 0:
+            connection = prev_connection
+            path.append(timetable.edge(connection))
+            prev_connection = rounds[ride_count][2][connection]
+        stop = timetable.start[connection]
+        ride_count -= 1
+    path.reverse()
+    return path
@@ -0,0 +1,212 @@
+import argparse
+import asyncio
+import http.client
+import json
+import math
+import sys
+import timeit
+from datetime import time
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, parse_qs, urlencode
+from astar import astar, astar_from, manhattan_distance, euclidean_distance, chebyshev_distance
+from batch import create_pool, route_on_worker
+from dijkstra import dijkstra, dijkstra_from
+from spatial import StopIndex, walking_origins
+from Utils import Graph, Edge, Criteria
+
+HEURISTICS = {'manhattan': manhattan_distance, 'euclidean': euclidean_distance, 'chebyshev': chebyshev_distance}
+
+
+class RequestError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class LatencyCounters:
+    """Request count, error count and latency totals per endpoint, all latencies in milliseconds."""
+
+    def __init__(self):
+        self.endpoints: Dict[str, Dict[str, float]] = {}
+
+    def record(self, endpoint: str, latency_ms: float, error: bool) -> None:
+        counters = self.endpoints.setdefault(endpoint, {'requests': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+        counters['requests'] += 1
+        counters['errors'] += error
+        counters['total_ms'] += latency_ms
+        counters['max_ms'] = max(counters['max_ms'], latency_ms)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return {endpoint: {**counters, 'mean_ms': counters['total_ms'] / counters['requests']}
+                for endpoint, counters in self.endpoints.items()}
+
+
+class RoutingServer:
+    """Keeps one Graph loaded and answers routing queries over HTTP/1.0 with JSON bodies:
+
+        GET /dijkstra?start=Hynka&goal=Malinowskiego&time=19:58:00
+        GET /astar?start=Hynka&goal=Malinowskiego&time=19:58:00&criteria=t&heuristic=landmarks
+        GET /dijkstra?lat=51.1&lon=17.03&radius=500&goal=Malinowskiego&time=19:58:00
+        GET /stats
+
+    A position instead of a start stop routes from the stops within walking distance of it.
+
+    Searches run in a worker pool, the event loop only parses requests and serializes results."""
+
+    def __init__(self, graph: Graph, workers: Optional[int] = None, processes: bool = True):
+        self.graph = graph
+        if graph.landmarks is None:
+            graph.preprocess_landmarks()
+        self.index = StopIndex(graph)
+        self.pool = create_pool(graph, workers, processes)
+        self.counters = LatencyCounters()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8080, unix_path: Optional[str] = None) -> None:
+        if unix_path is not None:
+            server = await asyncio.start_unix_server(self.handle, path=unix_path)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+    def close(self) -> None:
+        self.pool.shutdown()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        begin_time = timeit.default_timer()
+        endpoint = 'invalid'
+        status, body = 500, {'error': 'internal error'}
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            if len(request_line) < 2 or request_line[0] != 'GET':
+                raise RequestError(405, 'only GET requests are supported')
+            url = urlsplit(request_line[1])
+            endpoint = url.path
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            status, body = 200, await self.dispatch(endpoint, params)
+        except RequestError as e:
+            status, body = e.status, {'error': str(e)}
+        except Exception as e:
+            print(f'Request "{endpoint}" failed: {e!r}', file=sys.stderr)
+        finally:
+            latency_ms = (timeit.default_timer() - begin_time) * 1000
+            self.counters.record(endpoint, latency_ms, status != 200)
+
+        payload = json.dumps(body).encode('utf-8')
+        writer.write(f'HTTP/1.0 {status} {http.client.responses.get(status, "")}\r\n'
+                     f'Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n'.encode('latin-1'))
+        writer.write(payload)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def dispatch(self, endpoint: str, params: Dict[str, str]) -> dict:
+        if endpoint == '/stats':
+            return self.counters.summary()
+        if endpoint not in ('/dijkstra', '/astar'):
+            raise RequestError(404, f'unknown endpoint "{endpoint}"')
+        from_position = 'start' not in params and 'lat' in params
+        if endpoint == '/dijkstra':
+            solver = dijkstra_from if from_position else dijkstra
+        else:
+            solver = self._astar_solver(params, from_position)
+
+        query = self._parse_query(params, from_position)
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(self.pool, route_on_worker, solver, query)
+        if from_position:
+            cost, origin, path = result
+        else:
+            cost, path = result
+            origin = query[0]
+        return {'cost': None if math.isinf(cost) else cost, 'origin': origin,
+                'path': [_edge_to_json(edge) for edge in path]}
+
+    def _parse_query(self, params: Dict[str, str], from_position: bool = False) -> tuple:
+        try:
+            goal = params['goal']
+            time_zero = time.fromisoformat(params['time'])
+            if from_position:
+                start = walking_origins(self.index, float(params['lat']), float(params['lon']),
+                                        int(params.get('k', 5)), float(params.get('radius', 500)))
+                if not start:
+                    raise RequestError(404, 'no stop within walking distance')
+            else:
+                start = params['start']
+        except KeyError as e:
+            raise RequestError(400, f'missing parameter {e}')
+        except ValueError as e:
+            raise RequestError(400, f'invalid parameter: {e}')
+        for stop in (goal,) if from_position else (start, goal):
+            if stop not in self.graph.nodes:
+                raise RequestError(404, f'unknown stop "{stop}"')
+        return start, goal, time_zero
+
+    def _astar_solver(self, params: Dict[str, str], from_position: bool = False) -> Callable:
+        try:
+            criteria = Criteria[params.get('criteria', 't')]
+        except KeyError:
+            raise RequestError(400, f'unknown criteria "{params["criteria"]}"')
+        if from_position and criteria != Criteria.t:
+            raise RequestError(400, 'routing from a position only supports the time criteria')
+        heuristic = params.get('heuristic', 'landmarks')
+        if heuristic == 'landmarks':
+            return _astar_from_landmarks if from_position else partial(_astar_landmarks, criteria=criteria)
+        if heuristic not in HEURISTICS:
+            raise RequestError(400, f'unknown heuristic "{heuristic}"')
+        if from_position:
+            return partial(astar_from, heurestics=HEURISTICS[heuristic])
+        return partial(astar, criteria=criteria, heurestics=HEURISTICS[heuristic])
+
+
+def _astar_landmarks(graph: Graph, start: str, goal: str, time_zero: time, criteria: Criteria) -> Tuple[float, List[Edge]]:
+    # The landmarks live on the worker's copy of the graph, so they are looked up there
+    return astar(graph, start, goal, time_zero, criteria, graph.landmarks)
+
+
+def _astar_from_landmarks(graph: Graph, origins: List[Tuple[str, int]], goal: str,
+                          time_zero: time) -> Tuple[float, Optional[str], List[Edge]]:
+    return astar_from(graph, origins, goal, time_zero, graph.landmarks)
+
+
+def _edge_to_json(edge: Edge) -> dict:
+    return {'line': edge.line, 'start': edge.start, 'stop': edge.stop,
+            'departure_time': edge.departure_time.isoformat(), 'arrival_time': edge.arrival_time.isoformat()}
+
+
+def query_server(endpoint: str, host: str = '127.0.0.1', port: int = 8080, **params) -> Tuple[int, dict]:
+    """Minimal local client, returns the status and the decoded JSON body."""
+    connection = http.client.HTTPConnection(host, port, timeout=30)
+    try:
+        connection.request('GET', f'{endpoint}?{urlencode(params)}' if params else endpoint)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local routing service keeping the timetable loaded')
+    parser.add_argument('--csv', default='connection_graph.csv')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--unix', default=None, help='serve on this Unix socket instead of TCP')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--threads', action='store_true', help='run searches on threads instead of processes')
+    args = parser.parse_args()
+
+    server = RoutingServer(Graph.from_csv(args.csv), args.workers, not args.threads)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
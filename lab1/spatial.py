@@ -0,0 +1,67 @@
+import heapq
+import math
+from datetime import time
+from typing import Callable, Dict, List, Optional, Tuple
+from dijkstra import dijkstra_from
+from Utils import Graph, Edge
+
+EARTH_RADIUS_M = 6371000
+WALKING_SPEED_MS = 1.4
+
+
+class StopIndex:
+    """Uniform grid over the stop coordinates of a Graph. Positions are projected to metres around the mean
+    latitude, which is accurate enough at the scale of one city, so a query only measures the stops in the cells
+    that overlap its radius."""
+
+    def __init__(self, graph: Graph, cell_size: float = 250.0):
+        stops = graph.timetable.stops
+        self.cell_size = cell_size
+        self.lat0 = math.radians(sum(stop.lat for stop in stops) / len(stops)) if stops else 0.0
+        self.names: List[str] = [stop.name for stop in stops]
+        self.xs: List[float] = []
+        self.ys: List[float] = []
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+        for stop_id, stop in enumerate(stops):
+            x, y = self._project(stop.lat, stop.lon)
+            self.xs.append(x)
+            self.ys.append(y)
+            self.cells.setdefault((int(x // cell_size), int(y // cell_size)), []).append(stop_id)
+
+    def nearest(self, lat: float, lon: float, k: int = 5, radius: float = 500.0) -> List[Tuple[str, float]]:
+        """Up to ``k`` stops within ``radius`` metres of the position as (stop name, distance in metres), closest
+        first."""
+        x, y = self._project(lat, lon)
+        cell_size = self.cell_size
+        xs, ys = self.xs, self.ys
+        radius_sq = radius * radius
+        found = []
+        for cx in range(int((x - radius) // cell_size), int((x + radius) // cell_size) + 1):
+            for cy in range(int((y - radius) // cell_size), int((y + radius) // cell_size) + 1):
+                for stop_id in self.cells.get((cx, cy), ()):
+                    distance_sq = (xs[stop_id] - x) ** 2 + (ys[stop_id] - y) ** 2
+                    if distance_sq <= radius_sq:
+                        found.append((distance_sq, stop_id))
+        return [(self.names[stop_id], math.sqrt(distance_sq)) for distance_sq, stop_id in heapq.nsmallest(k, found)]
+
+    def _project(self, lat: float, lon: float) -> Tuple[float, float]:
+        return (EARTH_RADIUS_M * math.radians(lon) * math.cos(self.lat0),
+                EARTH_RADIUS_M * math.radians(lat))
+
+
+def walking_origins(index: StopIndex, lat: float, lon: float, k: int = 5, radius: float = 500.0,
+                    walking_speed: float = WALKING_SPEED_MS) -> List[Tuple[str, int]]:
+    """The stops around a position as origins for ``dijkstra_from``/``astar_from``, offsets in whole seconds."""
+    return [(name, math.ceil(distance / walking_speed)) for name, distance in index.nearest(lat, lon, k, radius)]
+
+
+def route_from_position(graph: Graph, index: StopIndex, lat: float, lon: float, goal: str, time_zero: time,
+                        solver: Callable = dijkstra_from, k: int = 5, radius: float = 500.0,
+                        walking_speed: float = WALKING_SPEED_MS) -> Tuple[float, Optional[str], List[Edge]]:
+    """Earliest arrival at ``goal`` when starting on foot at a position, the walk to the first stop is included in
+    the cost. A* is run by passing e.g. ``partial(astar_from, heurestics=manhattan_distance)`` as the solver.
+    Returns (inf, None, []) when no stop is within ``radius``."""
+    origins = walking_origins(index, lat, lon, k, radius, walking_speed)
+    if not origins:
+        return float('inf'), None, []
+    return solver(graph, origins, goal, time_zero)